@@ -1,15 +1,24 @@
+import base64
+import hashlib
 import json
 from datetime import datetime
 import requests
 import os
 import pandas as pd
 import functools
+import threading
+import time
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 from requests.auth import HTTPBasicAuth
 from app.src.loggin import logger
 from typing import List, Dict, Set
 
 _DEFAULT_TIMEOUT_SECONDS = 30
+# lifetime assumed for the tokens that do not tell their expiry
+_DEFAULT_TOKEN_TTL_SECONDS = 300
+# tokens are refreshed this long before they expire
+_TOKEN_REFRESH_MARGIN_SECONDS = 30
 
 
 def _get_default_retries():
@@ -23,54 +32,198 @@ def _get_default_retries():
         status_forcelist=[500, 502, 503, 504])
 
 
+class TokenProvider:
+    """
+    Bearer token of the ops cactus auth endpoint, cached until shortly before it expires. The expiry comes from the
+    exp claim of the token when it is a JWT, from expires_in when the auth response has it and from ttl_seconds
+    otherwise. A provider is shared by every client of the same auth_url and credentials, see for_auth_url, and can be
+    used from several threads.
+    """
+    _providers = {}
+    _providers_lock = threading.Lock()
+
+    def __init__(self, auth_url: str, user: str, password: str, ttl_seconds: float = _DEFAULT_TOKEN_TTL_SECONDS,
+                 refresh_margin_seconds: float = _TOKEN_REFRESH_MARGIN_SECONDS):
+        self._auth_url = auth_url
+        self._user = user
+        self._password = password
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._token = None
+        self._expires_at = 0.
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.request = functools.partial(self.session.request,
+                                                 timeout=_DEFAULT_TIMEOUT_SECONDS)
+        retries = _get_default_retries()
+
+        self.session.mount('http://',
+                           requests.adapters.HTTPAdapter(max_retries=retries))
+        self.session.mount('https://',
+                           requests.adapters.HTTPAdapter(max_retries=retries))
+
+    @classmethod
+    def for_auth_url(cls, auth_url: str, user: str, password: str) -> 'TokenProvider':
+        # the password is only kept by the provider itself, the registry holds its hash
+        key = (auth_url, user, hashlib.sha256(password.encode()).hexdigest())
+        with cls._providers_lock:
+            if key not in cls._providers:
+                cls._providers[key] = cls(auth_url, user, password)
+            return cls._providers[key]
+
+    def token(self) -> str:
+        with self._lock:
+            # refreshed ahead of the expiry so that a token does not expire on its way to the API
+            if self._token is None or time.time() >= self._expires_at - self.refresh_margin_seconds:
+                self._authenticate()
+            return self._token
+
+    def invalidate(self, token: str):
+        # only the rejected token, another thread may have refreshed it already
+        with self._lock:
+            if self._token == token:
+                self._token = None
+
+    def _authenticate(self):
+        basic = HTTPBasicAuth(self._user, self._password)
+        url = f'{self._auth_url}/ops-public-api/v1/pri/fed/ops-cactus/api/v2/auth/token'
+        res = self.session.post(url, auth=basic)
+        res.raise_for_status()
+        json_res = res.json()
+        now = time.time()
+        expires_at = self._jwt_expiry(json_res["token"])
+        if expires_at is None and 'expires_in' in json_res:
+            expires_at = now + float(json_res['expires_in'])
+        self._token = json_res["token"]
+        self._expires_at = expires_at if expires_at is not None else now + self.ttl_seconds
+        logger.debug(f"A token was issued for {self._auth_url}, it expires in {self._expires_at - now:.0f} s")
+
+    @staticmethod
+    def _jwt_expiry(token: str):
+        try:
+            payload = token.split('.')[1]
+            claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+            return float(claims['exp'])
+        except (IndexError, ValueError, KeyError, TypeError):
+            return None
+
+
+def _post_with_token(session: requests.Session, token_provider: TokenProvider, url: str,
+                     **kwargs) -> requests.Response:
+    """
+    Post with the bearer token of the provider, once more with a new token if the API rejects it
+    """
+    token = token_provider.token()
+    response = session.post(url, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+    if response.status_code == 401:
+        token_provider.invalidate(token)
+        response = session.post(url, headers={'Authorization': f'Bearer {token_provider.token()}'}, **kwargs)
+    response.raise_for_status()
+    return response
+
+
 class MLOpsClient:
 
-    def __init__(self, url, api_key):
+    def __init__(self, url, api_key, max_concurrent_pages: int = 4, pool_size: int = None):
         self.url = url
         self.api_key = api_key
+        self.max_concurrent_pages = max_concurrent_pages
 
-    def get_waste_by_age(self, todays_date: datetime, warehouse_code: str = None, limit: int = 5000,
-                         fields=None) -> dict:
-        if fields is None:
-            fields = ["sku_code",
-                      "waste_per_age"]
+        # one kept alive connection for every page in flight unless told otherwise
+        pool_size = max_concurrent_pages if pool_size is None else pool_size
+        self.session = requests.Session()
+        self.session.request = functools.partial(self.session.request,
+                                                 timeout=_DEFAULT_TIMEOUT_SECONDS)
+        retries = _get_default_retries()
 
-        complete_response = []
-        pg = 0
-        while True:
-            pg += 1
-            payload = json.dumps({
-                "model": "waste_per_age",
+        self.session.mount('http://',
+                           requests.adapters.HTTPAdapter(max_retries=retries, pool_maxsize=pool_size))
+        self.session.mount('https://',
+                           requests.adapters.HTTPAdapter(max_retries=retries, pool_maxsize=pool_size))
+
+        self.session.headers.update({'Content-Type': 'application/json',
+                                     'Authorization': self.api_key})
+
+        # requests, seconds and bytes received by model, updated from the page threads
+        self.endpoint_stats = {}
+        self._endpoint_stats_lock = threading.Lock()
+
+    def _get_page(self, model: str, payload: str) -> list:
+        start = time.perf_counter()
+        response = self.session.get(self.url, data=payload)
+        response.raise_for_status()
+        elapsed = time.perf_counter() - start
+        with self._endpoint_stats_lock:
+            stats = self.endpoint_stats.setdefault(model, {'requests': 0, 'seconds': 0., 'bytes': 0})
+            stats['requests'] += 1
+            stats['seconds'] += elapsed
+            stats['bytes'] += len(response.content)
+        return response.json()["result"]
+
+    def _get_all_pages(self, model: str, conditions: List[dict], limit: int, fields: List[str]) -> list:
+        """
+        Results of every page of a query up to the first empty one. The pages are requested in order by a window of
+        max_concurrent_pages concurrent requests, so at most that many pages past the last one are requested
+        """
+        def payload(page):
+            return json.dumps({
+                "model": model,
                 "vertical": "planning",
-                "page": pg,
+                "page": page,
                 "limit": limit,
                 "query": {
                     "condition_type": "AND",
-                    "conditions": [
-                        {
-                            "field": "created_at",
-                            "value": todays_date,
-                            "comparison": "gte"
-                        },
-                        {
-                            "field": "warehouse_code",
-                            'value': warehouse_code,
-                            'comparison': 'e'
-                        }
-
-                    ]
+                    "conditions": conditions
                 },
                 "fields_to_return": fields
             })
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': self.api_key
-            }
 
-            response = requests.request("GET", self.url, headers=headers, data=payload)
-            complete_response += response.json()["result"]
-            if len(response.json()["result"]) == 0:
-                break
+        results = {}
+        first_empty_page = None
+        next_page = 1
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_pages) as executor:
+            pending = {}
+            while True:
+                while len(pending) < self.max_concurrent_pages and (first_empty_page is None
+                                                                    or next_page < first_empty_page):
+                    pending[executor.submit(self._get_page, model, payload(next_page))] = next_page
+                    next_page += 1
+                if len(pending) == 0:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page = pending.pop(future)
+                    results[page] = future.result()
+                    if len(results[page]) == 0 and (first_empty_page is None or page < first_empty_page):
+                        first_empty_page = page
+                # the pages past the first empty one are not waited for
+                for future in [future for future, page in pending.items() if page > (first_empty_page or page)]:
+                    future.cancel()
+                    pending.pop(future)
+        stats = self.endpoint_stats[model]
+        logger.debug(f"{first_empty_page - 1} pages of {model} were fetched, {stats['requests']} requests took "
+                     f"{stats['seconds']:.2f} s and {stats['bytes']} bytes so far")
+        return [result for page in range(1, first_empty_page) for result in results[page]]
+
+    def get_waste_by_age(self, todays_date: datetime, warehouse_code: str = None, limit: int = 5000,
+                         fields=None) -> dict:
+        if fields is None:
+            fields = ["sku_code",
+                      "waste_per_age"]
+
+        complete_response = self._get_all_pages("waste_per_age", [
+            {
+                "field": "created_at",
+                "value": todays_date,
+                "comparison": "gte"
+            },
+            {
+                "field": "warehouse_code",
+                'value': warehouse_code,
+                'comparison': 'e'
+            }
+        ], limit, fields)
 
         return {v['sku_code']: v['waste_per_age'] for v in complete_response}
 
@@ -82,37 +235,13 @@ class MLOpsClient:
             fields = ["sku_code",
                       "forecast_error_model"]
 
-        complete_response = []
-        pg = 0
-        while True:
-            pg += 1
-            payload = json.dumps({
-                "model": "forecast_errors",
-                "vertical": "planning",
-                "page": pg,
-                "limit": limit,
-                "query": {
-                    "condition_type": "AND",
-                    "conditions": [
-                        {
-                            "field": "warehouse_code",
-                            'value': warehouse_code,
-                            'comparison': 'e'
-                        }
-
-                    ]
-                },
-                "fields_to_return": fields
-            })
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': self.api_key
+        complete_response = self._get_all_pages("forecast_errors", [
+            {
+                "field": "warehouse_code",
+                'value': warehouse_code,
+                'comparison': 'e'
             }
-
-            response = requests.request("GET", self.url, headers=headers, data=payload)
-            complete_response += response.json()["result"]
-            if len(response.json()["result"]) == 0:
-                break
+        ], limit, fields)
         return {v['sku_code']: v['forecast_error_model']['params'] for v in complete_response}
 
     def get_lead_times(self
@@ -128,45 +257,19 @@ class MLOpsClient:
                       "warehouse_code",
                       "supplier_id"]
 
-        pg = 0
-        complete_response = []
-        while True:
-            pg += 1
-            payload = json.dumps({
-                "model": "lead_times",
-                "vertical": "planning",
-                "page": pg,
-                "limit": limit,
-                "query": {
-                    "condition_type": "AND",
-                    "conditions": [
-
-                        {
-                            "field": "warehouse_code",
-                            'value': warehouse_code,
-                            'comparison': 'e'
-                        },
-                        {
-                            "field": "day_of_week",
-                            "value": int(datetime.strptime(execution_date, "%Y-%m-%d").weekday()),
-                            "comparison": "e"
-                        }
-
-                    ]
-                },
-                "fields_to_return": fields
-            })
-
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': self.api_key
+        complete_response = self._get_all_pages("lead_times", [
+            {
+                "field": "warehouse_code",
+                'value': warehouse_code,
+                'comparison': 'e'
+            },
+            {
+                "field": "day_of_week",
+                "value": int(datetime.strptime(execution_date, "%Y-%m-%d").weekday()),
+                "comparison": "e"
             }
-            logger.info(f"Payload: {payload}")
-            response = requests.request("GET", self.url, headers=headers, data=payload)
-            logger.info(f"Response: {response.json()}")
-            complete_response += response.json()["result"]
-            if len(response.json()["result"]) == 0:
-                break
+        ], limit, fields)
+        logger.info(f"{len(complete_response)} lead times were fetched for warehouse {warehouse_code}")
 
         lead_time_models = {}
         for v in complete_response:
@@ -187,47 +290,18 @@ class MLOpsClient:
                       "percentage_cost_per_unit_shortage",
                       "percentage_cash_margin_per_unit"]
 
-        pg = 0
-        complete_response = []
-        while True:
-            pg += 1
-            payload = json.dumps({
-                "model": "inventory_costs",
-                "vertical": "planning",
-                "page": pg,
-                "limit": limit,
-                "query": {
-                    "condition_type": "AND",
-                    "conditions": [
-                        {
-                            "field": "warehouse_code",
-                            'value': warehouse_code,
-                            'comparison': 'e'
-                        },
-                        {
-                            "field": "purchase_type",
-                            "value": purchase_type,
-                            "comparison": "e"
-                        }
-                    ]
-                },
-                "fields_to_return": fields
-            })
-
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': self.api_key
+        complete_response = self._get_all_pages("inventory_costs", [
+            {
+                "field": "warehouse_code",
+                'value': warehouse_code,
+                'comparison': 'e'
+            },
+            {
+                "field": "purchase_type",
+                "value": purchase_type,
+                "comparison": "e"
             }
-            #print(payload)
-
-
-            response = requests.request("GET", self.url, headers=headers, data=payload)
-            # print curl
-            #print(response.json())
-
-            complete_response += response.json()["result"]
-            if len(response.json()["result"]) == 0:
-                break
+        ], limit, fields)
         complete_response = {v['sku_code']: v for v in complete_response}
         complete_response = {k: {'percentage_cost_per_unit_excess': float(v['percentage_cost_per_unit_excess']),
                                  'percentage_cost_per_unit_shortage': float(v['percentage_cost_per_unit_shortage']),
@@ -245,43 +319,18 @@ class MLOpsClient:
             fields = ["sku_code",
                       "waste_per_age"]
 
-        complete_response = []
-
-        pg = 0
-        while True:
-            pg += 1
-            payload = json.dumps({
-                "model": "waste_per_age",
-                "vertical": "planning",
-                "page": pg,
-                "limit": limit,
-                "query": {
-                    "condition_type": "AND",
-                    "conditions": [
-                        {
-                            "field": "created_at",
-                            "value": todays_date,
-                            "comparison": "gte"
-                        },
-                        {
-                            "field": "warehouse_code",
-                            'value': warehouse_code,
-                            'comparison': 'e'
-                        }
-
-                    ]
-                },
-                "fields_to_return": fields
-            })
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': self.api_key
+        complete_response = self._get_all_pages("waste_per_age", [
+            {
+                "field": "created_at",
+                "value": todays_date,
+                "comparison": "gte"
+            },
+            {
+                "field": "warehouse_code",
+                'value': warehouse_code,
+                'comparison': 'e'
             }
-
-            response = requests.request("GET", self.url, headers=headers, data=payload)
-            complete_response += response.json()["result"]
-            if len(response.json()["result"]) == 0:
-                break
+        ], limit, fields)
 
         return {v['sku_code']: v['waste_per_age'] for v in complete_response}
 
@@ -307,24 +356,15 @@ class AvailableStockPRApiClient:
                            requests.adapters.HTTPAdapter(max_retries=retries))
         self.session.mount('https://',
                            requests.adapters.HTTPAdapter(max_retries=retries))
-
-    def _authenticate(self):
-        basic = HTTPBasicAuth(self._user, self._password)
-        url = f'{self._auth_url}/ops-public-api/v1/pri/fed/ops-cactus/api/v2/auth/token'
-        res = self.session.post(url, auth=basic)
-        res.raise_for_status()
-        json_res = res.json()
-        self.session.headers.update({'Authorization': f'Bearer {json_res["token"]}'})
+        # the token is shared with the other clients of the same auth_url
+        self._token_provider = TokenProvider.for_auth_url(auth_url, user, password)
 
     def get_available_stock(
             self,
             products_ids: list
     ) -> dict:
-        # Authenticate always as there's no way to check validity of last token
-        self._authenticate()
         url = f'{self._url}/pr-stock-available/v1/stocks/wh-product-id'
-        requests_response = self.session.post(url, json=products_ids)
-        requests_response.raise_for_status()
+        requests_response = _post_with_token(self.session, self._token_provider, url, json=products_ids)
         return requests_response.json()
 
 class InTransitStockPRApiClient:
@@ -349,14 +389,8 @@ class InTransitStockPRApiClient:
                            requests.adapters.HTTPAdapter(max_retries=retries))
         self.session.mount('https://',
                            requests.adapters.HTTPAdapter(max_retries=retries))
-
-    def _authenticate(self):
-        basic = HTTPBasicAuth(self._user, self._password)
-        url = f'{self._auth_url}/ops-public-api/v1/pri/fed/ops-cactus/api/v2/auth/token'
-        res = self.session.post(url, auth=basic)
-        res.raise_for_status()
-        json_res = res.json()
-        self.session.headers.update({'Authorization': f'Bearer {json_res["token"]}'})
+        # the token is shared with the other clients of the same auth_url
+        self._token_provider = TokenProvider.for_auth_url(auth_url, user, password)
 
     def get_in_transit_stock(
             self,
@@ -367,8 +401,26 @@ class InTransitStockPRApiClient:
             excluded_types=None
 
     ) -> dict:
-        # Authenticate always as there's no way to check validity of last token
-        self._authenticate()
+        return self._request_in_transit_stock(skus, warehouse, initial_date, final_date, excluded_types)
+
+    def get_in_transit_stock_by_day(
+            self,
+            skus: list,
+            warehouse: str,
+            days: List[str],
+            excluded_types=None,
+            max_workers: int = 8
+    ) -> Dict[str, list]:
+        """
+        In transit stock of every day on its own, requested concurrently
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = executor.map(
+                lambda day: self._request_in_transit_stock(skus, warehouse, day, day, excluded_types), days)
+            return dict(zip(days, responses))
+
+    def _request_in_transit_stock(self, skus: list, warehouse: str, initial_date: str, final_date: str,
+                                  excluded_types=None) -> list:
         url = f'{self._url}/pr-purchases/orders/apricot-query/stock-in-transit'
 
         message = {
@@ -382,8 +434,7 @@ class InTransitStockPRApiClient:
 
 
         logger.debug(f"Requesting in transit stock with message: {message}")
-        requests_response = self.session.post(url, json=message)
-        requests_response.raise_for_status()
+        requests_response = _post_with_token(self.session, self._token_provider, url, json=message)
         logger.debug(f"Response: {requests_response.json()}")
         return requests_response.json()
 
@@ -397,8 +448,10 @@ class InTransitStockPRApiClient:
 # ================================================================================
 
 class InTransitStockService:
-    def __init__(self, in_transit_stock_api_client: InTransitStockPRApiClient):
+    def __init__(self, in_transit_stock_api_client: InTransitStockPRApiClient, date_field: str = None):
         self._available_stock_api_client = in_transit_stock_api_client
+        # field of the in transit records that holds their date, when the API has one
+        self.date_field = date_field
 
     def get_in_transit_stock(self, sku_ids: list
                              , warehouse: str
@@ -413,28 +466,53 @@ class InTransitStockService:
             final_date
             , excluded_types
         )
+        return self._quantity_by_sku(pr_res)
+
+    @staticmethod
+    def _quantity_by_sku(pr_res: list) -> dict:
         in_transit_stock = {}
         for current_pr_product in pr_res:
             in_transit_stock.update({current_pr_product['sku']: current_pr_product['quantity']})
 
         return in_transit_stock
 
+    @staticmethod
+    def _summed_quantity_by_sku(pr_res: list) -> dict:
+        # a sku can be in transit in several purchase orders, its quantity is the sum of them
+        in_transit_stock = {}
+        for current_pr_product in pr_res:
+            sku = current_pr_product['sku']
+            in_transit_stock[sku] = in_transit_stock.get(sku, 0) + current_pr_product['quantity']
+        return in_transit_stock
+
     def get_detailed_in_transit_stock(self, sku_ids: List[str]
                              , warehouse: str
                              , initial_date: str
                              , final_date: str
                              , excluded_types:List[str] = None
+                             , date_field: str = None
+                             , max_workers: int = 8
                              ) -> dict:
-        in_transit_by_date = {}
-
-        for fecha in pd.date_range(start=initial_date, end=final_date):
-            df = self.get_in_transit_stock(sku_ids
-                                          , warehouse
-                                          , fecha.strftime('%Y-%m-%d')
-                                          , fecha.strftime('%Y-%m-%d')
-                                          , excluded_types
-                                          )
-            in_transit_by_date[fecha.strftime('%Y-%m-%d')] = df
+        """
+        In transit stock by sku and date, the quantities of the records of a sku and date are summed in both modes. When
+        the records of the API carry their date in date_field, by default the one of the service, which Container takes
+        from IN_TRANSIT_STOCK_DATE_FIELD, the whole range comes in a single request. Otherwise every day is requested
+        on its own, concurrently, which is what runs unless that variable is set
+        """
+        date_field = date_field if date_field is not None else self.date_field
+        if date_field is not None:
+            return self._get_in_transit_stock_by_date_field(sku_ids, warehouse, initial_date, final_date,
+                                                            excluded_types, date_field)
+
+        days = [fecha.strftime('%Y-%m-%d') for fecha in pd.date_range(start=initial_date, end=final_date)]
+        pr_res_by_day = self._available_stock_api_client.get_in_transit_stock_by_day(
+            sku_ids,
+            warehouse,
+            days,
+            excluded_types,
+            max_workers
+        )
+        in_transit_by_date = {fecha: self._summed_quantity_by_sku(pr_res) for fecha, pr_res in pr_res_by_day.items()}
 
         in_transit_by_sku = {}
         for fecha in in_transit_by_date:
@@ -444,6 +522,26 @@ class InTransitStockService:
                 in_transit_by_sku[sku][fecha] = in_transit_by_date[fecha][sku]
         return in_transit_by_sku
 
+    def _get_in_transit_stock_by_date_field(self, sku_ids: List[str], warehouse: str, initial_date: str,
+                                            final_date: str, excluded_types: List[str], date_field: str) -> dict:
+        pr_res = self._available_stock_api_client.get_in_transit_stock(
+            sku_ids,
+            warehouse,
+            initial_date,
+            final_date
+            , excluded_types
+        )
+        first_day, last_day = initial_date[:10], final_date[:10]
+        in_transit_by_sku = {}
+        for current_pr_product in pr_res:
+            # YYYY-MM-DD
+            fecha = str(current_pr_product[date_field])[:10]
+            if not first_day <= fecha <= last_day:
+                continue
+            in_transit_by_date = in_transit_by_sku.setdefault(current_pr_product['sku'], {})
+            in_transit_by_date[fecha] = in_transit_by_date.get(fecha, 0) + current_pr_product['quantity']
+        return in_transit_by_sku
+
 
 class AvailableStockService:
     def __init__(self, available_stock_api_client: AvailableStockPRApiClient):
@@ -476,9 +574,12 @@ class AvailableStockService:
 
 class DemandPlanningForecastClient:
 
-    def __init__(self, url, api_key):
+    def __init__(self, url, api_key, chunk_size: int = 500, max_workers: int = 4):
         self.url = url
         self._token = api_key
+        # product ids per request and requests in flight
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
 
         self.content_type = 'application/json'
         self.session = requests.Session()
@@ -487,16 +588,37 @@ class DemandPlanningForecastClient:
         retries = _get_default_retries()
 
         self.session.mount('http://',
-                           requests.adapters.HTTPAdapter(max_retries=retries))
+                           requests.adapters.HTTPAdapter(max_retries=retries, pool_maxsize=max_workers))
         self.session.mount('https://',
-                           requests.adapters.HTTPAdapter(max_retries=retries))
+                           requests.adapters.HTTPAdapter(max_retries=retries, pool_maxsize=max_workers))
 
         self.session.headers.update({'Content-Type': 'application/json'})
 
         self.session.headers.update({"X-API-TOKEN": self._token})
 
     def get_batch_forecasts_skus(self, params: dict):
+        """
+        Daily forecast of every product id, requested in chunks of chunk_size ids by max_workers concurrent requests and
+        merged as the chunks arrive
+        """
+        product_ids = params['product_ids']
+        chunks = [product_ids[i:i + self.chunk_size] for i in range(0, len(product_ids), self.chunk_size)]
+        start = time.perf_counter()
+
+        forecast = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._get_forecasts_chunk, params, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                for forecast_item in future.result():
+                    forecast_by_date = forecast.setdefault(forecast_item['id'], {})
+                    for forecast_date in forecast_item['forecastDates']:
+                        forecast_by_date[forecast_date['forecastDate']] = forecast_date['quantity']
+
+        logger.info(f"Forecasts of {len(forecast)} of {len(product_ids)} products were fetched in {len(chunks)} "
+                    f"requests in {time.perf_counter() - start:.2f} s")
+        return forecast
 
+    def _get_forecasts_chunk(self, params: dict, product_ids: list) -> list:
         url = self.url + '/forecasts-service/cms/forecasts/daily-forecast/list'
 
         payload = json.dumps({
@@ -504,24 +626,15 @@ class DemandPlanningForecastClient:
             'end_date': params['end_date'],
             'region': params['region_code'],
             'warehouse': params['warehouse_code'],
-            'product_ids': params['product_ids']
+            'product_ids': product_ids
 
         })
-        print(payload)
-
-
-        logger.info(f"payload: {payload}")
-        logger.info(f" ==================================== token: {self._token} ==================================== ")
 
+        start = time.perf_counter()
         requests_response = self.session.post(url
                                               , data=payload
-                                              ).json()
-
-        forecast = {}
-        logger.info(f"requests_response: {requests_response}")
-        for forecast_item in requests_response:
-            forecast[forecast_item['id']] = {}
-            for forecast_date in forecast_item['forecastDates']:
-                forecast[forecast_item['id']][forecast_date['forecastDate']] = forecast_date['quantity']
-        return forecast
-
+                                              )
+        requests_response.raise_for_status()
+        logger.debug(f"Forecasts of {len(product_ids)} products: {len(payload)} bytes sent and "
+                     f"{len(requests_response.content)} received in {time.perf_counter() - start:.2f} s")
+        return requests_response.json()
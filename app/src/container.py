@@ -78,7 +78,7 @@ class Container:
                 os.environ['CACTUS_USER'],
                 os.environ['CACTUS_PASS']
             )
-            self._in_transit_stock_service = InTransitStockService(itss)
+            self._in_transit_stock_service = InTransitStockService(itss, os.getenv('IN_TRANSIT_STOCK_DATE_FIELD'))
         return self._in_transit_stock_service
 
     def get_dp_forecast_client(self):
@@ -1,3 +1,6 @@
+from dataclasses import dataclass
+from functools import lru_cache
+
 from app.src.classes import Product
 from datetime import datetime, timedelta
 import numpy as np
@@ -8,10 +11,17 @@ from abc import ABC, abstractmethod
 from app.src.loggin import logger
 from enum import Enum
 
+KDE_CACHE_SIZE = 4096
+
 
 class RandomVariatesGenerator(ABC):
-    def __init__(self, forecast_error_model):
+    def __init__(self, forecast_error_model, random_state: np.random.Generator = None):
+        """
+        random_state: numpy generator the variates are drawn from, usually a stream of RandomStreams, the global
+        numpy state is used when it is None
+        """
         self.forecast_error_model = forecast_error_model
+        self.random_state = random_state if random_state is not None else np.random
         self.validate_error_model()
 
     def validate_error_model(self):
@@ -26,10 +36,52 @@ class RandomVariatesGenerator(ABC):
     def generate(self, location: float, sample_size: int = 1):
         pass
 
+    @abstractmethod
+    def generate_from_uniforms(self, location: float, uniforms: np.ndarray):
+        """
+        Maps uniform draws in [0, 1) to variates through the inverse of the cumulative distribution, so that the
+        sampling strategy of the uniforms carries over to the variates
+        """
+        pass
+
+    def generate_batch(self, locations: np.ndarray, sample_size: int = 1):
+        """
+        (sample x location) matrix with sample_size independent variates for each location
+        """
+        return np.column_stack([self.generate(location, sample_size) for location in locations])
+
+    def generate_batch_from_uniforms(self, locations: np.ndarray, uniforms: np.ndarray):
+        """
+        generate_from_uniforms for every location at once, uniforms being a (sample x location) matrix
+        """
+        return np.column_stack([self.generate_from_uniforms(location, uniforms[:, k])
+                                for k, location in enumerate(locations)])
+
+    @abstractmethod
+    def distribution(self, location: float):
+        """
+        Values the generated variates can take, sorted, and their probabilities
+        """
+        pass
+
+    def expected_value(self, location: float) -> float:
+        values, probabilities = self.distribution(location)
+        return float(np.dot(values, probabilities))
+
+    def variance(self, location: float) -> float:
+        values, probabilities = self.distribution(location)
+        return float(np.dot((values - np.dot(values, probabilities)) ** 2, probabilities))
+
+    @staticmethod
+    def _inverse_discrete_cdf(values: np.ndarray, probabilities: np.ndarray, uniforms: np.ndarray):
+        cumulative_probabilities = np.cumsum(probabilities)
+        index = np.searchsorted(cumulative_probabilities / cumulative_probabilities[-1], uniforms, side='right')
+        return values[np.minimum(index, len(values) - 1)]
+
 
 class TruncatedNormalRandomVariatesGenerator(RandomVariatesGenerator):
-    def __init__(self, forecast_error_model):
-        super().__init__(forecast_error_model)
+    def __init__(self, forecast_error_model, random_state: np.random.Generator = None):
+        super().__init__(forecast_error_model, random_state)
         if self.forecast_error_model.get('distribution', None) != 'NORM':
             raise ValueError("The demand location error distribution is not normal")
 
@@ -45,13 +97,127 @@ class TruncatedNormalRandomVariatesGenerator(RandomVariatesGenerator):
             _sigma=0.0001
         return np.round(scipy.stats.truncnorm.rvs((self.min_value - (forecast + self.mu)) / _sigma,
                                                   (self.max_value - (forecast + self.mu)) / _sigma,
-                                                  loc=(forecast + self.mu), scale=_sigma, size=sample_size), 0)
+                                                  loc=(forecast + self.mu), scale=_sigma, size=sample_size,
+                                                  random_state=self._scipy_random_state()), 0)
+
+    def _scipy_random_state(self):
+        # scipy reads the global numpy state when it is given None
+        return None if self.random_state is np.random else self.random_state
+
+    def _truncated_normal(self, forecast: float):
+        _sigma = self.sigma if self.sigma > 0 else 0.0001
+        return scipy.stats.truncnorm((self.min_value - (forecast + self.mu)) / _sigma,
+                                     (self.max_value - (forecast + self.mu)) / _sigma,
+                                     loc=(forecast + self.mu), scale=_sigma)
+
+    def generate_from_uniforms(self, forecast: float, uniforms: np.ndarray):
+        return self.generate_batch_from_uniforms(np.array([forecast]), uniforms[:, None])[:, 0]
+
+    def generate_batch(self, forecasts: np.ndarray, sample_size: int = 1):
+        # drawn day after day, so that a batch of days draws the same variates as the same days split in batches
+        return self.generate_batch_from_uniforms(forecasts, self.random_state.random((len(forecasts), sample_size)).T)
+
+    def generate_batch_from_uniforms(self, forecasts: np.ndarray, uniforms: np.ndarray):
+        # inverse cumulative distribution of the normal restricted to the probabilities above the truncation point,
+        # without building a frozen scipy distribution per forecast
+        _sigma = self.sigma if self.sigma > 0 else 0.0001
+        locations = np.asarray(forecasts, dtype=float) + self.mu
+        lower_probabilities = scipy.special.ndtr((self.min_value - locations) / _sigma)
+        return np.round(locations + _sigma * scipy.special.ndtri(
+            lower_probabilities + uniforms * (1 - lower_probabilities)), 0)
+
+    def moments(self, forecasts: np.ndarray):
+        """
+        Mean and variance of the variates, before rounding, for every forecast at once
+        """
+        _sigma = self.sigma if self.sigma > 0 else 0.0001
+        locations = np.asarray(forecasts, dtype=float) + self.mu
+        alpha = (self.min_value - locations) / _sigma
+        # inverse Mills ratio of the lower truncation point, the upper one is at infinity
+        mills_ratio = np.exp(-alpha ** 2 / 2) / np.sqrt(2 * np.pi) / scipy.special.ndtr(-alpha)
+        return (locations + _sigma * mills_ratio,
+                _sigma ** 2 * (1 + alpha * mills_ratio - mills_ratio ** 2))
+
+    def distribution(self, forecast: float):
+        # probabilities of the rounded variates, the tails beyond 10 standard deviations are left out
+        _sigma = self.sigma if self.sigma > 0 else 0.0001
+        values = np.arange(max(self.min_value, np.floor(forecast + self.mu - 10 * _sigma)),
+                           np.ceil(forecast + self.mu + 10 * _sigma) + 1)
+        truncated_normal = self._truncated_normal(forecast)
+        probabilities = np.diff(truncated_normal.cdf(values + 0.5), prepend=truncated_normal.cdf(values[0] - 0.5))
+        return values, probabilities / probabilities.sum()
+
+
+def alias_table(probabilities: np.ndarray):
+    """
+    Walker alias table of a discrete distribution, built with Vose's method: column k is kept with probability
+    acceptance[k] and replaced by alias[k] otherwise, so each draw takes one random column and one comparison
+    """
+    scaled_probabilities = np.asarray(probabilities, dtype=float) * len(probabilities) / np.sum(probabilities)
+    acceptance = np.ones(len(probabilities))
+    alias = np.arange(len(probabilities))
+    small = [k for k, p in enumerate(scaled_probabilities) if p < 1]
+    large = [k for k, p in enumerate(scaled_probabilities) if p >= 1]
+    while small and large:
+        k_small, k_large = small.pop(), large.pop()
+        acceptance[k_small] = scaled_probabilities[k_small]
+        alias[k_small] = k_large
+        scaled_probabilities[k_large] -= 1 - scaled_probabilities[k_small]
+        (small if scaled_probabilities[k_large] < 1 else large).append(k_large)
+    return acceptance, alias
+
+
+@dataclass(frozen=True)
+class DiscreteDistribution:
+    """
+    values: sorted values of the distribution
+    probabilities: probability of each value
+    acceptance, alias: Walker alias table of the probabilities
+    """
+    values: np.ndarray
+    probabilities: np.ndarray
+    acceptance: np.ndarray
+    alias: np.ndarray
+
+    @staticmethod
+    def from_observations(observations: np.ndarray) -> 'DiscreteDistribution':
+        values, counts = np.unique(observations, return_counts=True)
+        probabilities = counts / len(observations)
+        return DiscreteDistribution(values, probabilities, *alias_table(probabilities))
+
+    def draw(self, sample_size: int, random_state=np.random):
+        # the integer part of each scaled uniform picks the column and the fractional part decides on the alias
+        scaled_uniforms = random_state.random(sample_size) * len(self.values)
+        columns = scaled_uniforms.astype(int)
+        columns = np.where(scaled_uniforms - columns < self.acceptance[columns], columns, self.alias[columns])
+        return self.values[columns]
+
+
+@lru_cache(maxsize=KDE_CACHE_SIZE)
+def fit_discrete_distribution(forecast_error: tuple, location: float) -> DiscreteDistribution:
+    """
+    Distribution of the demand around location given the observed forecast errors, smoothed with a gaussian KDE.
+    Fits are kept for the KDE_CACHE_SIZE most recently used (errors, location) pairs, since every simulation asks
+    for the same few locations over and over
+    """
+    fcst = location - np.array(forecast_error, dtype=float)
+    fcst = fcst[fcst >= 0]
+
+    if len(fcst) == 0:
+        fcst = np.array([location])
+    if np.std(fcst) == 0:
+        logger.warning("Not enough data to construct the KDE")
+        return DiscreteDistribution.from_observations(fcst.astype(int))
+    dens = sm.nonparametric.KDEUnivariate(fcst)
+    dens.fit(bw='scott', kernel='gau')
+    return DiscreteDistribution.from_observations(dens.icdf.astype(int))
 
 
 class DiscreteRandomVariatesGenerator(RandomVariatesGenerator):
 
-    def __init__(self, forecast_error_model):
-        super().__init__(forecast_error_model)
+    def __init__(self, forecast_error_model, random_state: np.random.Generator = None):
+        super().__init__(forecast_error_model, random_state)
+        self._forecast_error = tuple(self.forecast_error_model.get('values', [0]))
         self._kde = None
 
     def construct_kde(self,
@@ -59,22 +225,7 @@ class DiscreteRandomVariatesGenerator(RandomVariatesGenerator):
                       ):
         if self.forecast_error_model.get('distribution', None) != 'DISC':
             raise ValueError("The demand location error distribution is not discrete")
-
-        forecast_error = self.forecast_error_model.get('values', [0])
-
-        fcst = [location - i for i in forecast_error]
-        fcst = [i for i in fcst]
-        fcst = [i for i in fcst if i >= 0]
-
-        if len(fcst) == 0:
-            fcst = [location]
-        if np.std(fcst) == 0 or len(fcst) == 0:
-            logger.warning("Not enough data to construct the KDE")
-            self._kde = self.probability_of_each_value_in_list([int(i) for i in fcst])
-        else:
-            dens = sm.nonparametric.KDEUnivariate(fcst)
-            dens.fit(bw='scott', kernel='gau')
-            self._kde = self.probability_of_each_value_in_list([int(i) for i in list(dens.icdf)])
+        self._kde = fit_discrete_distribution(self._forecast_error, float(location))
 
     @staticmethod
     def probability_of_each_value_in_list(list_values: list):
@@ -83,36 +234,77 @@ class DiscreteRandomVariatesGenerator(RandomVariatesGenerator):
         :param list_values:
         :return:
         """
-        # logger.info("Computing probability of each value in the list")
-        total = len(list_values)
-        dict_prob = {}
-        for i in list_values:
-            dict_prob[i] = list_values.count(i) / total
-        return dict_prob
+        values, counts = np.unique(list_values, return_counts=True)
+        return dict(zip(values.tolist(), (counts / len(list_values)).tolist()))
 
     def generate(self, forecast: float, sample_size: int = 1):
         self.construct_kde(forecast)
-        vals = list(self._kde.keys())
-        weights = [self._kde[v] for v in vals]
-        return np.random.choice(vals, sample_size, p=weights)
+        return self._kde.draw(sample_size, self.random_state)
 
+    def generate_from_uniforms(self, forecast: float, uniforms: np.ndarray):
+        return self._inverse_discrete_cdf(*self.distribution(forecast), uniforms)
 
-class WeightedDiscreteRandomVariatesGenerator(RandomVariatesGenerator):
-    def __init__(self, forecast_error_model):
-        super().__init__(forecast_error_model)
-        self._prob_value_pairs = None
+    def distribution(self, forecast: float):
+        self.construct_kde(forecast)
+        return self._kde.values.astype(float), self._kde.probabilities
 
-    def generate(self, location: float, sample_size: int = 1):
+
+class WeightedDiscreteRandomVariatesGenerator(RandomVariatesGenerator):
+    def __init__(self, forecast_error_model, random_state: np.random.Generator = None):
+        super().__init__(forecast_error_model, random_state)
         self._prob_value_pairs = self.forecast_error_model.get('prob_value_pairs', None)
+        if self._prob_value_pairs is None:
+            raise ValueError("The demand location error distribution is not discrete")
         try:
-            self._prob_value_pairs ={float(k):v for k,v in self._prob_value_pairs.items()}
+            self._prob_value_pairs = {float(k): v for k, v in self._prob_value_pairs.items()}
         except:
             raise ValueError("The keys of the demand location error distribution must be numeric")
-        if self._prob_value_pairs is None:
-            raise ValueError("The demand location error distribution is not discrete")
-        vals = np.array([float(v) for v in self._prob_value_pairs.keys()])
-        weights = [self._prob_value_pairs[v] for v in vals]
-        return np.random.choice(vals+location, sample_size, p=weights)
+        # compiled once, every draw only shifts the values by the location
+        values = np.array(sorted(self._prob_value_pairs.keys()))
+        probabilities = np.array([self._prob_value_pairs[v] for v in values], dtype=float)
+        self._distribution = DiscreteDistribution(values, probabilities, *alias_table(probabilities))
+
+    def generate(self, location: float, sample_size: int = 1):
+        return self._distribution.draw(sample_size, self.random_state) + location
+
+    def generate_from_uniforms(self, location: float, uniforms: np.ndarray):
+        return self._inverse_discrete_cdf(*self.distribution(location), uniforms)
+
+    def generate_batch(self, locations: np.ndarray, sample_size: int = 1):
+        locations = np.asarray(locations, dtype=float)
+        # drawn location after location, as TruncatedNormalRandomVariatesGenerator.generate_batch
+        variates = self._distribution.draw(sample_size * len(locations), self.random_state)
+        return variates.reshape(len(locations), sample_size).T + locations
+
+    def generate_batch_from_uniforms(self, locations: np.ndarray, uniforms: np.ndarray):
+        return (self._inverse_discrete_cdf(self._distribution.values, self._distribution.probabilities, uniforms)
+                + np.asarray(locations, dtype=float))
+
+    def distribution(self, location: float):
+        return self._distribution.values + location, self._distribution.probabilities
+
+
+class MonteCarloSampler:
+    @staticmethod
+    def uniforms(sample_size: int, random_state=np.random):
+        return random_state.random(sample_size)
+
+
+class AntitheticSampler:
+    @staticmethod
+    def uniforms(sample_size: int, random_state=np.random):
+        # consecutive pairs (u, 1 - u), an odd sample size leaves the last draw unpaired
+        uniforms = np.empty(sample_size)
+        uniforms[0::2] = random_state.random((sample_size + 1) // 2)
+        uniforms[1::2] = 1 - uniforms[0:sample_size - 1:2]
+        return uniforms
+
+
+class LatinHypercubeSampler:
+    @staticmethod
+    def uniforms(sample_size: int, random_state=np.random):
+        # one draw in each of the sample_size equally likely strata, in random order
+        return (random_state.permutation(sample_size) + random_state.random(sample_size)) / sample_size
 
 
 class RandomVariates(Enum):
@@ -149,6 +341,36 @@ class RandomVariates(Enum):
         raise ValueError(f"Distribution {code} is not supported")
 
 
+class SamplingStrategies(Enum):
+    MONTE_CARLO = ('MC', 'Independent draws', MonteCarloSampler)
+    ANTITHETIC = ('ANTITHETIC', 'Pairs of negatively correlated draws', AntitheticSampler)
+    LATIN_HYPERCUBE = ('LHS', 'Stratified draws, one per stratum of each day', LatinHypercubeSampler)
+
+    def __init__(self, code, description, sampler):
+        self._code = code
+        self._description = description
+        self._sampler = sampler
+
+    @property
+    def code(self):
+        return self._code
+
+    @property
+    def description(self):
+        return self._description
+
+    @property
+    def sampler(self):
+        return self._sampler
+
+    @staticmethod
+    def get_strategy_by_code(code):
+        for strategy in SamplingStrategies:
+            if strategy.code == code:
+                return strategy
+        raise ValueError(f"Sampling strategy {code} is not supported")
+
+
 if __name__ == '__main__':
     # forecast_error_model = {'distribution': 'DISC', 'values': [0,1,3,4,4,5,5]}
     # forecast_error_model = {'distribution': 'NORM', 'mu': 10, 'sigma': 20.1}
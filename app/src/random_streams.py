@@ -0,0 +1,49 @@
+import hashlib
+
+import numpy as np
+
+LEAD_TIME = 'lead_time'
+DEMAND = 'demand'
+# uniforms shared by the origin and destination simulations of a product
+PAIRED = 'paired'
+
+
+def stable_words(*parts) -> tuple:
+    # stable across processes and runs, unlike hash()
+    digest = hashlib.sha256('|'.join(str(part) for part in parts).encode()).digest()
+    return tuple(int.from_bytes(digest[i:i + 4], 'little') for i in range(0, 16, 4))
+
+
+class RandomStreams:
+    """
+    Registry of independent random streams, keyed by (seed, warehouse, sku, role). Each stream is the child of the root
+    SeedSequence that SeedSequence.spawn would produce under a spawn key derived from the stream key, instead of the
+    spawn order, so the same stream comes out in any process and in any order and the curves of a product do not
+    depend on how the simulations are split or scheduled. The execution is left out of the key on purpose: a rerun of
+    the same inputs draws the same numbers, so its curves can come from the simulation cache.
+    """
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+        self._root = np.random.SeedSequence(seed)
+        self._seed_sequences = {}
+
+    def seed_sequence(self, warehouse: str, sku: str, role: str) -> np.random.SeedSequence:
+        key = (warehouse, sku, role)
+        if key not in self._seed_sequences:
+            self._seed_sequences[key] = np.random.SeedSequence(
+                self._root.entropy, spawn_key=self._root.spawn_key + stable_words(*key))
+        return self._seed_sequences[key]
+
+    def generator(self, warehouse: str, sku: str, role: str) -> np.random.Generator:
+        """
+        Generator at the start of the stream, every call starts over so that repeated simulations of a product see
+        the same draws
+        """
+        return np.random.default_rng(self.seed_sequence(warehouse, sku, role))
+
+    def identifier(self, warehouse: str, sku: str) -> int:
+        """
+        Stable integer that identifies the streams of a product, to tell apart results drawn from different streams
+        """
+        return stable_words(self.seed, warehouse, sku)[0]
@@ -0,0 +1,115 @@
+import dataclasses
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+from app.src.classes import Product
+from app.src.loggin import logger
+from app.src.simulator import SimulationSettings, select_supplier
+
+# version of the curves the simulators produce, part of every key. Bump it whenever a change to the simulators or the
+# random variates generators changes the curves of the same inputs, so that the entries of earlier versions are missed
+SIMULATION_CACHE_VERSION = 1
+
+# settings that change how fast the curves are computed but not the curves themselves
+_RESULT_NEUTRAL_SETTINGS = {'batched', 'max_batch_elements', 'bisection_search', 'low_memory', 'warehouse_batched',
+                            'max_workers', 'analytic_cross_check'}
+
+
+class SimulationCache:
+    """
+    On-disk cache of the lost sales and waste curves of product simulations, one json file per entry named after a
+    stable hash of everything the curves depend on. The least recently used entries are evicted once the files take
+    more than max_size_bytes.
+    """
+
+    def __init__(self, directory: str, max_size_bytes: int = 256 * 1024 ** 2):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+        # key -> (size in bytes, last access time)
+        self._entries = {}
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                self._entries[entry.name[:-len('.json')]] = (stat.st_size, stat.st_mtime)
+
+    @staticmethod
+    def key(product: Product, is_origin: bool, settings: SimulationSettings, sample_size: int, seed: Optional[int],
+            max_value_to_transfer: int = None) -> str:
+        settings = settings if settings is not None else SimulationSettings()
+        content = {
+            'version': SIMULATION_CACHE_VERSION,
+            'forecast': product.forecast,
+            'forecast_error_model': product.forecast_error_model,
+            'lead_time_model': select_supplier(product).lead_time_model,
+            'current_inventory': product.current_inventory,
+            'detailed_incoming_inventory': product.detailed_incoming_inventory,
+            'desired_service_level': product.desired_service_level,
+            'days_to_next_review': product.days_to_next_review,
+            'units_per_product_dim': product.units_per_product_dim,
+            'lots_expiration_by_date': product.lots_expiration_by_date,
+            'is_origin': is_origin,
+            'settings': {k: v for k, v in dataclasses.asdict(settings).items() if k not in _RESULT_NEUTRAL_SETTINGS},
+            'sample_size': sample_size,
+            'seed': seed,
+            'max_value_to_transfer': max_value_to_transfer
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        try:
+            with open(self._path(key)) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            # removed or left half written by another run
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        now = time.time()
+        os.utime(self._path(key), (now, now))
+        self._entries[key] = (self._entries[key][0], now)
+        self.hits += 1
+        # quantities are stored as pairs since json objects only have string keys
+        return {curve: {q: v for q, v in pairs} for curve, pairs in stored.items()}
+
+    def put(self, key: str, curves: dict):
+        content = json.dumps({curve: [[q, v] for q, v in values.items()] for curve, values in curves.items()})
+        temporary_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w') as f:
+            f.write(content)
+        os.replace(temporary_path, self._path(key))
+        self._entries[key] = (len(content), time.time())
+        self._evict()
+
+    def _evict(self):
+        total_size = sum(size for size, _ in self._entries.values())
+        if total_size <= self.max_size_bytes:
+            return
+        evicted = 0
+        for key, (size, _) in sorted(self._entries.items(), key=lambda entry: entry[1][1]):
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            del self._entries[key]
+            total_size -= size
+            evicted += 1
+        logger.debug(f"{evicted} simulation cache entries were evicted")
+
+    @property
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries),
+                'size_bytes': sum(size for size, _ in self._entries.values())}
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.src.classes import Product
+
+SUNDAY = 6
+
+
+def weekdays(start_date: np.datetime64, length: int) -> np.ndarray:
+    # 1970-01-01, day zero of datetime64[D], was a thursday
+    return ((start_date + np.arange(length)).astype(int) + 3) % 7
+
+
+@dataclass
+class ProductCalendar:
+    """
+    Dated inputs of a product aligned on the day offset from the first forecast date, the simulations index every
+    array by that offset instead of parsing and looking up dates.
+
+    forecast: forecasted units per day, zero outside of the forecast
+    in_forecast: whether the day is in the forecast, the inventory only moves on those days
+    incoming_inventory: units received on each day, only counted on days in the forecast
+    selling_days: False on sundays, when there is no demand
+    """
+    start_date: np.datetime64
+    forecast: np.ndarray
+    in_forecast: np.ndarray
+    incoming_inventory: np.ndarray
+    selling_days: np.ndarray
+
+    @staticmethod
+    def from_product(product: Product) -> 'ProductCalendar':
+        forecast_dates = np.array(list(product.forecast.keys()), dtype='datetime64[D]')
+        start_date = forecast_dates.min()
+        offsets = (forecast_dates - start_date).astype(int)
+        length = int(offsets.max()) + 1
+
+        forecast = np.zeros(length)
+        forecast[offsets] = [float(v) for v in product.forecast.values()]
+        in_forecast = np.zeros(length, dtype=bool)
+        in_forecast[offsets] = True
+        dates = np.datetime_as_string(start_date + np.arange(length))
+        incoming_inventory = np.array([product.detailed_incoming_inventory.get(date, 0) for date in dates],
+                                      dtype=float) * in_forecast
+
+        return ProductCalendar(
+            start_date=start_date,
+            forecast=forecast,
+            in_forecast=in_forecast,
+            incoming_inventory=incoming_inventory,
+            selling_days=weekdays(start_date, length) != SUNDAY
+        )
+
+    def __len__(self):
+        return len(self.forecast)
+
+    def window(self, planning_horizon_length: int) -> 'ProductCalendar':
+        """
+        Calendar of the first planning_horizon_length days, the days after the end of the forecast have neither
+        demand nor receptions
+        """
+        padding = (0, max(0, planning_horizon_length - len(self)))
+        return ProductCalendar(
+            start_date=self.start_date,
+            forecast=np.pad(self.forecast[:planning_horizon_length], padding),
+            in_forecast=np.pad(self.in_forecast[:planning_horizon_length], padding),
+            incoming_inventory=np.pad(self.incoming_inventory[:planning_horizon_length], padding),
+            selling_days=weekdays(self.start_date, planning_horizon_length) != SUNDAY
+        )
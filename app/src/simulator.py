@@ -1,15 +1,19 @@
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from typing import List, Dict
 
 import scipy as sp
 from app.src.loggin import logger
-from app.src.ramdom_variates_generator import RandomVariates
+from app.src.ramdom_variates_generator import RandomVariates, SamplingStrategies
 from app.src.classes import Product, Supplier
+from app.src.simulation_calendar import ProductCalendar
+from app.src.random_streams import RandomStreams, LEAD_TIME, DEMAND, PAIRED
 import numpy as np
 from abc import ABC, abstractmethod
 
 from enum import Enum
 
+DEFAULT_SAMPLE_SIZE = 500
+
 
 def select_supplier(product: Product):
     # Defines the rule to be used to select the supplier
@@ -30,12 +34,64 @@ def estimate_sample_size(desired_halfwidth, confidence, sigma):
     return int((z * sigma / desired_halfwidth) ** 2)
 
 
+def control_variate_mean(values, control):
+    """
+    Mean of values along the last axis corrected with a control variate, control holds the deviation of each sample
+    of the control from its known expected value. The corrected means are floored at zero, as lost sales can not be
+    negative.
+    """
+    centered_control = control - np.mean(control)
+    variance = np.mean(centered_control ** 2)
+    if variance == 0:
+        return np.mean(values, axis=-1)
+    beta = np.mean(values * centered_control, axis=-1) / variance
+    return np.maximum(0, np.mean(values, axis=-1) - beta * np.mean(control))
+
+
+@dataclass
+class SimulationSettings:
+    """
+    batched: evaluate every candidate quantity in a single vectorized pass instead of one pass per quantity
+    max_batch_elements: upper bound on the size of the (quantity x sample x day) tensors evaluated at once
+    bisection_search: locate the stopping point with galloping and bisection before filling in the curve
+    sequential_sampling: keep the pilot scenarios and only draw the extra ones required by the halfwidth check
+    max_sample_size: cap on the number of scenarios reached through sequential sampling
+    low_memory: keep running per-sample accumulators instead of the lost sales and stockouts matrices
+    warehouse_batched: simulate all the products of a warehouse together with WarehouseInventorySimulator
+    max_workers: number of processes that Solver.get_products_params spreads the product simulations over
+    sampling: code of the SamplingStrategies used to draw the demand and lead times, other than MC they draw through
+        the inverse cumulative distribution of the generators
+    control_variate: correct the expected lost sales with the total demand of each sample, whose expected value is
+        known, as a control variate
+    analytic: compute the curves in closed form, with AnalyticInventorySimulator, for the products that allow it. The
+        closed form is a normal approximation of the simulation, not an exact equivalent
+    analytic_cross_check: also simulate the products computed in closed form and log how far apart the curves are
+    paired: simulate the origin and destination of each product together with PairedInventorySimulator, on common
+        random numbers. Paired curves are not cached, since each one depends on both products
+    """
+    batched: bool = True
+    max_batch_elements: int = 2 ** 22
+    bisection_search: bool = False
+    sequential_sampling: bool = False
+    max_sample_size: int = 100000
+    low_memory: bool = False
+    warehouse_batched: bool = False
+    max_workers: int = 1
+    sampling: str = 'MC'
+    control_variate: bool = False
+    analytic: bool = False
+    analytic_cross_check: bool = False
+    paired: bool = False
+
+
 class Simulator(ABC):
 
-    def __init__(self, product: Product, is_origin: bool):
+    def __init__(self, product: Product, is_origin: bool, settings: SimulationSettings = None,
+                 random_streams: RandomStreams = None):
         self._stockout_units_by_quantity = None
         self._wasted_units_by_quantity = None
-        pass
+        self.settings = settings if settings is not None else SimulationSettings()
+        self.random_streams = random_streams
 
     @abstractmethod
     def simulate(self, sample_size: int = 10000):
@@ -58,64 +114,221 @@ class NonPerishableInventorySimulator(Simulator):
     lead_time_generator: RandomVariates
     forecast: dict
     detailed_incoming_inventory: dict
+    calendar: ProductCalendar
     _step_size: int
     _node_type: int
 
-    def __init__(self, product: Product, is_origin: bool):
-        super().__init__(product, is_origin)
+    def __init__(self, product: Product, is_origin: bool, settings: SimulationSettings = None,
+                 random_streams: RandomStreams = None):
+        super().__init__(product, is_origin, settings, random_streams)
 
         self.product = product
         self.forecast_error_model = self.product.forecast_error_model
         self.lead_time_model = select_supplier(self.product).lead_time_model
         self.forecast_error_generator = RandomVariates.get_distribution_by_code(
-            self.forecast_error_model.get('distribution', None)).generator(self.forecast_error_model)
+            self.forecast_error_model.get('distribution', None)).generator(self.forecast_error_model,
+                                                                           self._random_state(DEMAND))
         self.lead_time_generator = RandomVariates.get_distribution_by_code(
-            self.lead_time_model.get('distribution', None)).generator(self.lead_time_model)
+            self.lead_time_model.get('distribution', None)).generator(self.lead_time_model,
+                                                                      self._random_state(LEAD_TIME))
         self.forecast = self.product.forecast
         self.detailed_incoming_inventory = self.product.detailed_incoming_inventory
+        self.calendar = ProductCalendar.from_product(self.product)
         self._step_size = self.product.units_per_product_dim
         self._node_type = 1 if is_origin else 0
+        self.sampling = SamplingStrategies.get_strategy_by_code(self.settings.sampling)
+        self._control = None
+
+    def _random_state(self, role: str):
+        # without a registry the draws come from the global numpy state
+        if self.random_streams is None:
+            return None
+        return self.random_streams.generator(self.product.warehouse, self.product.sku, role)
+
+    def simulate(self, max_value_to_transfer: int = None, sample_size: int = DEFAULT_SAMPLE_SIZE):
+
+        self.simulate_scenarios(*self.draw_scenarios(sample_size), max_value_to_transfer=max_value_to_transfer)
+
+    def simulate_scenarios(self, lead_time_vector, calendar, demand_scenarios, max_value_to_transfer: int = None):
+        """
+        Evaluates the candidate quantities on scenarios drawn beforehand
+        """
+        self._control = self._control_variate(lead_time_vector, calendar, demand_scenarios)
+
+        if self.settings.bisection_search:
+            results_by_transfer = self._evaluate_quantities_by_search(lead_time_vector, calendar,
+                                                                      demand_scenarios, max_value_to_transfer)
+        elif self.settings.batched:
+            results_by_transfer = self._evaluate_quantities_batched(lead_time_vector, calendar,
+                                                                    demand_scenarios, max_value_to_transfer)
+        else:
+            results_by_transfer = self._evaluate_quantities_sequentially(lead_time_vector, calendar,
+                                                                         demand_scenarios, max_value_to_transfer)
 
-    def simulate(self, max_value_to_transfer: int = None, sample_size: int = 500):
-
-        lead_time_vector = self.lead_time_generator.generate(0, sample_size) + self.product.days_to_next_review
-        simulation_dates = [
-            datetime.strftime(datetime.strptime(min(self.product.forecast.keys()), "%Y-%m-%d") + timedelta(days=i),
-                              "%Y-%m-%d") for i in range(int(max(lead_time_vector)) + 1)]
-        planning_horizon_length = len(simulation_dates)
-
-        waste = np.zeros((sample_size, planning_horizon_length))
-        lost_sales = np.zeros((sample_size, planning_horizon_length))
-        stockouts = np.zeros((sample_size, planning_horizon_length))
+        self._stockout_units_by_quantity = {k: float(v['lost_sales']) for k, v in results_by_transfer.items()}
+        self._wasted_units_by_quantity = {k: float(v['waste']) for k, v in results_by_transfer.items()}
 
-        demand_scenarios = np.array([self.forecast_error_generator.generate(self.forecast.get(date, 0), sample_size) * (
-                datetime.strptime(date, "%Y-%m-%d").weekday() != 6) for date in simulation_dates]).T
+    def draw_scenarios(self, sample_size: int = DEFAULT_SAMPLE_SIZE):
+        """
+        Draws the lead time of each sample, the calendar window of the planning horizon and the (sample x day) demand
+        scenarios, with enough samples for a 2% halfwidth on the expected demand
+        """
+        lead_time_vector, calendar, demand_scenarios = self._draw_scenarios(sample_size)
 
-        total_demand = np.zeros(sample_size)
-        for i, date in enumerate(simulation_dates):
-            if date in self.product.forecast:
-                total_demand += demand_scenarios[:, i] * (i <= lead_time_vector)
-        interval = confidence_interval(total_demand)
+        total_demand = self._total_demand(lead_time_vector, calendar, demand_scenarios)
+        interval = self._demand_interval(total_demand)
         logger.info(
-            f" the expected demand is {np.mean(total_demand)} and the halfwidth is {confidence_interval(total_demand)[1]}")
-        if interval[0] != 0 and interval[1] / interval[0] * 100 >= 2:
+            f" the expected demand is {np.mean(total_demand)} and the halfwidth is {interval[1]}")
+        if self.settings.sequential_sampling:
+            lead_time_vector, calendar, demand_scenarios = self._extend_scenarios(
+                lead_time_vector, calendar, demand_scenarios)
+        elif interval[0] != 0 and interval[1] / interval[0] * 100 >= 2:
             new_h = interval[0] * 0.02
-            sample_size = estimate_sample_size(new_h, 0.95, np.std(total_demand))
+            sample_size = self._required_sample_size(total_demand, new_h)
             logger.warning(f"the sample size was increased to {sample_size}")
-            lead_time_vector = self.lead_time_generator.generate(0, sample_size) + self.product.days_to_next_review
-            simulation_dates = [
-                datetime.strftime(datetime.strptime(min(self.product.forecast.keys()), "%Y-%m-%d") + timedelta(days=i),
-                                  "%Y-%m-%d") for i in range(int(max(lead_time_vector)) + 1)]
-            planning_horizon_length = len(simulation_dates)
-
-            waste = np.zeros((sample_size, planning_horizon_length))
+            lead_time_vector, calendar, demand_scenarios = self._draw_scenarios(sample_size)
+        return lead_time_vector, calendar, demand_scenarios
+
+    def _draw_scenarios(self, sample_size: int):
+        if self.sampling is SamplingStrategies.ANTITHETIC:
+            # every batch is made of whole pairs so that the pairs stay aligned when batches are stacked
+            sample_size += sample_size % 2
+        lead_time_vector = self._generate(self.lead_time_generator, 0, sample_size) + self.product.days_to_next_review
+        calendar = self.calendar.window(int(max(lead_time_vector)) + 1)
+
+        # demand is only drawn on the selling days of the forecast, it is never read on any other day. The days are
+        # drawn in blocks of at most max_batch_elements variates, the generators draw day after day so the scenarios
+        # do not depend on the block size
+        demand_scenarios = np.zeros((sample_size, len(calendar)))
+        days = np.flatnonzero(calendar.in_forecast & calendar.selling_days)
+        block_size = max(1, self.settings.max_batch_elements // sample_size)
+        for start in range(0, len(days), block_size):
+            block = days[start:start + block_size]
+            demand_scenarios[:, block] = self._generate_batch(self.forecast_error_generator, calendar.forecast[block],
+                                                              sample_size)
+        return lead_time_vector, calendar, demand_scenarios
+
+    def scenarios_from_uniforms(self, lead_time_uniforms, demand_uniforms):
+        """
+        Scenarios drawn through the inverse cumulative distributions of the generators from the given uniforms,
+        demand_uniforms holding a column for every day from the first forecast date on. Simulators fed with the same
+        uniforms share their random numbers
+        """
+        lead_time_vector = (self.lead_time_generator.generate_from_uniforms(0, lead_time_uniforms)
+                            + self.product.days_to_next_review)
+        calendar = self.calendar.window(int(max(lead_time_vector)) + 1)
+        demand_scenarios = np.zeros((len(lead_time_vector), len(calendar)))
+        days = np.flatnonzero(calendar.in_forecast & calendar.selling_days)
+        demand_scenarios[:, days] = self.forecast_error_generator.generate_batch_from_uniforms(
+            calendar.forecast[days], demand_uniforms[:, days])
+        return lead_time_vector, calendar, demand_scenarios
+
+    def _generate(self, generator, location: float, sample_size: int):
+        if self.sampling is SamplingStrategies.MONTE_CARLO:
+            return generator.generate(location, sample_size)
+        # each call draws its own uniforms, so the stratification or pairing holds within every day and the lead times
+        return generator.generate_from_uniforms(
+            location, self.sampling.sampler.uniforms(sample_size, generator.random_state))
+
+    def _generate_batch(self, generator, locations: np.ndarray, sample_size: int):
+        if self.sampling is SamplingStrategies.MONTE_CARLO:
+            return generator.generate_batch(locations, sample_size)
+        return generator.generate_batch_from_uniforms(
+            locations, np.column_stack([self.sampling.sampler.uniforms(sample_size, generator.random_state)
+                                        for _ in locations]))
+
+    def _demand_interval(self, total_demand):
+        # antithetic and latin hypercube samples are treated as independent, which overstates the halfwidth. Pairs
+        # would make the nearly linear total demand look far more precise than the convex lost sales the curves are
+        # made of, so they must not shrink the sample
+        return confidence_interval(total_demand)
+
+    def _required_sample_size(self, total_demand, desired_halfwidth) -> int:
+        return estimate_sample_size(desired_halfwidth, 0.95, np.std(total_demand))
+
+    def _expected_total_demand(self, calendar):
+        # the demand of a day is counted when the day is within the lead time of the sample, lead times and demand
+        # are independent
+        lead_times, probabilities = self.lead_time_generator.distribution(0)
+        lead_times = lead_times + self.product.days_to_next_review
+        calendar = self.calendar.window(max(len(calendar), int(max(lead_times)) + 1))
+        days = np.flatnonzero(calendar.in_forecast & calendar.selling_days)
+        probability_of_counting = (days[:, None] <= lead_times[None, :]) @ probabilities
+        return sum(self.forecast_error_generator.expected_value(calendar.forecast[i]) * probability
+                   for i, probability in zip(days, probability_of_counting))
+
+    def _control_variate(self, lead_time_vector, calendar, demand_scenarios):
+        # deviation of the total demand of each sample from its expected value, None when the control variate is off
+        if not self.settings.control_variate:
+            return None
+        return (self._total_demand(lead_time_vector, calendar, demand_scenarios)
+                - self._expected_total_demand(calendar))
+
+    def _expected_lost_sales(self, total_lost_sales):
+        if self._control is None:
+            return np.mean(total_lost_sales, axis=-1)
+        return control_variate_mean(total_lost_sales, self._control)
+
+    def _total_demand(self, lead_time_vector, calendar, demand_scenarios):
+        total_demand = np.zeros(len(lead_time_vector))
+        for i in np.flatnonzero(calendar.in_forecast):
+            total_demand += demand_scenarios[:, i] * (i <= lead_time_vector)
+        return total_demand
+
+    def _extend_scenarios(self, lead_time_vector, calendar, demand_scenarios):
+        # keeps the scenarios drawn so far and only draws the extra batch the sample size estimate asks for, until
+        # the halfwidth of the expected demand is below 2% or max_sample_size is reached
+        while len(lead_time_vector) < self.settings.max_sample_size:
+            total_demand = self._total_demand(lead_time_vector, calendar, demand_scenarios)
+            interval = self._demand_interval(total_demand)
+            if interval[0] == 0 or interval[1] / interval[0] * 100 < 2:
+                break
+            sample_size = min(self._required_sample_size(total_demand, interval[0] * 0.02),
+                              self.settings.max_sample_size)
+            if sample_size <= len(lead_time_vector):
+                break
+            logger.warning(f"the sample size was extended from {len(lead_time_vector)} to {sample_size}")
+            extra_lead_times, extra_calendar, extra_demand = self._draw_scenarios(
+                sample_size - len(lead_time_vector))
+
+            # the shorter set of scenarios is padded with zero demand, those days are beyond its lead times anyway
+            planning_horizon_length = max(len(calendar), len(extra_calendar))
+            if len(extra_calendar) > len(calendar):
+                calendar = extra_calendar
+            lead_time_vector = np.concatenate([lead_time_vector, extra_lead_times])
+            demand_scenarios = np.vstack([
+                np.pad(demand_scenarios, ((0, 0), (0, planning_horizon_length - demand_scenarios.shape[1]))),
+                np.pad(extra_demand, ((0, 0), (0, planning_horizon_length - extra_demand.shape[1])))])
+        return lead_time_vector, calendar, demand_scenarios
+
+    def _is_stopping_point(self, Q_transfer, stockout_probability, max_value_to_transfer=None) -> bool:
+        if max_value_to_transfer is not None and Q_transfer >= max_value_to_transfer:
+            return True
+        if self._node_type == 1:
+            return (stockout_probability > 1 - self.product.desired_service_level
+                    or Q_transfer >= self.product.current_inventory)
+        return stockout_probability < 1 - self.product.desired_service_level
+
+    def _last_step(self, max_value_to_transfer=None):
+        # index of the last quantity that can be evaluated before the stopping point is reached regardless of the
+        # simulated stockouts, None when there is no such bound
+        bounds = []
+        if self._node_type == 1:
+            bounds.append(self.product.current_inventory)
+        if max_value_to_transfer is not None:
+            bounds.append(max_value_to_transfer)
+        if len(bounds) == 0:
+            return None
+        return max(0, int(np.ceil(min(bounds) / self._step_size)))
+
+    def _evaluate_quantities_sequentially(self, lead_time_vector, calendar, demand_scenarios,
+                                          max_value_to_transfer=None) -> dict:
+        # runs the inventory recursion once per candidate quantity until the stopping point is reached
+        sample_size, planning_horizon_length = demand_scenarios.shape
+        if not self.settings.low_memory:
             lost_sales = np.zeros((sample_size, planning_horizon_length))
             stockouts = np.zeros((sample_size, planning_horizon_length))
 
-            demand_scenarios = np.array(
-                [self.forecast_error_generator.generate(self.forecast.get(date, 0), sample_size) * (
-                        datetime.strptime(date, "%Y-%m-%d").weekday() != 6) for date in simulation_dates]).T
-
         Q_transfer = 0
         results_by_transfer = {}
 
@@ -123,32 +336,162 @@ class NonPerishableInventorySimulator(Simulator):
             inventory = np.zeros(sample_size) + self.product.current_inventory - Q_transfer * (
                 1 if self._node_type == 1 else -1)
 
-            for i, date in enumerate(simulation_dates):
-                if date in self.product.forecast:
+            if self.settings.low_memory:
+                total_lost_sales = np.zeros(sample_size)
+                stocked_out = np.zeros(sample_size, dtype=bool)
+                for i in np.flatnonzero(calendar.in_forecast):
+                    demand = demand_scenarios[:, i] * (i <= lead_time_vector)
+                    daily_lost_sales = np.maximum(0, demand - inventory)
+                    inventory = np.maximum(0, inventory - demand)
+                    if i < planning_horizon_length - 1:
+                        total_lost_sales += daily_lost_sales
+                        stocked_out |= daily_lost_sales > 0
+                    inventory += calendar.incoming_inventory[i]
+            else:
+                for i in np.flatnonzero(calendar.in_forecast):
                     demand = demand_scenarios[:, i] * (i <= lead_time_vector)
                     lost_sales[:, i] = np.maximum(0, demand - inventory)
                     inventory = np.maximum(0, inventory - demand)
                     stockouts[:, i] = lost_sales[:, i] > 0
-                    inventory += self.product.detailed_incoming_inventory.get(date, 0)
+                    inventory += calendar.incoming_inventory[i]
+                total_lost_sales = np.sum(lost_sales[:, :-1], axis=1)
+                stocked_out = np.sum(stockouts[:, :-1], axis=1) > 0
             new_res = {
-                "lost_sales": np.mean(np.sum(lost_sales[:, :-1], axis=1)),
-                "stockouts": np.mean(np.sum(stockouts[:, :-1], axis=1) > 0),
+                "lost_sales": self._expected_lost_sales(total_lost_sales),
+                "stockouts": np.mean(stocked_out),
                 "inventory": np.mean(inventory),
                 'waste': 0
             }
             results_by_transfer[Q_transfer] = new_res
-            if self._node_type == 1:
-                if (new_res['stockouts'] > 1 - self.product.desired_service_level
-                        or Q_transfer >= self.product.current_inventory):
-                    break
-            else:
-                if new_res['stockouts'] < 1 - self.product.desired_service_level:
-                    break
+            if self._is_stopping_point(Q_transfer, new_res['stockouts'], max_value_to_transfer):
+                break
 
             Q_transfer += self._step_size
 
-        self._stockout_units_by_quantity = {k: float(v['lost_sales']) for k, v in results_by_transfer.items()}
-        self._wasted_units_by_quantity = {k: float(v['waste']) for k, v in results_by_transfer.items()}
+        return results_by_transfer
+
+    def _recursion_inputs(self, lead_time_vector, calendar, demand_scenarios):
+        # day-major demand (zero after the lead time of each sample), the days on which the inventory moves and the
+        # units received on each day
+        planning_horizon_length = len(calendar)
+        if self.settings.low_memory:
+            # masks the scenarios in place and reads them through a transposed view instead of copying them
+            for i in range(planning_horizon_length):
+                demand_scenarios[:, i] *= i <= lead_time_vector
+            daily_demand = demand_scenarios.T
+        else:
+            daily_demand = np.ascontiguousarray(
+                (demand_scenarios * (np.arange(planning_horizon_length) <= lead_time_vector[:, None])).T)
+        return daily_demand, calendar.in_forecast, calendar.incoming_inventory
+
+    def _run_inventory_recursion(self, quantities, daily_demand, in_forecast, incoming) -> dict:
+        # runs the inventory recursion for several candidate quantities at once over a (quantity x sample x day)
+        # tensor, stored day-major so that every day of the recursion writes a contiguous slice
+        planning_horizon_length, sample_size = daily_demand.shape
+        direction = 1 if self._node_type == 1 else -1
+        inventory = (np.zeros((len(quantities), sample_size)) + self.product.current_inventory
+                     - direction * np.array(quantities)[:, None])
+
+        if self.settings.low_memory:
+            # running per-sample accumulators instead of the (quantity x sample x day) tensors, the last day of the
+            # horizon is not accumulated, as in the tensor version
+            total_lost_sales = np.zeros((len(quantities), sample_size))
+            stocked_out = np.zeros((len(quantities), sample_size), dtype=bool)
+            for i in np.flatnonzero(in_forecast):
+                daily_lost_sales = np.maximum(0, daily_demand[i] - inventory)
+                inventory = np.maximum(0, inventory - daily_demand[i])
+                if i < planning_horizon_length - 1:
+                    total_lost_sales += daily_lost_sales
+                    stocked_out |= daily_lost_sales > 0
+                inventory += incoming[i]
+        else:
+            lost_sales = np.zeros((planning_horizon_length, len(quantities), sample_size))
+            stockouts = np.zeros((planning_horizon_length, len(quantities), sample_size), dtype=bool)
+            for i in np.flatnonzero(in_forecast):
+                np.maximum(0, daily_demand[i] - inventory, out=lost_sales[i])
+                inventory = np.maximum(0, inventory - daily_demand[i])
+                np.greater(lost_sales[i], 0, out=stockouts[i])
+                inventory += incoming[i]
+            total_lost_sales = np.sum(lost_sales[:-1], axis=0)
+            stocked_out = np.any(stockouts[:-1], axis=0)
+
+        expected_lost_sales = self._expected_lost_sales(total_lost_sales)
+        stockout_probability = np.mean(stocked_out, axis=1)
+        expected_inventory = np.mean(inventory, axis=1)
+        return {Q_transfer: {
+            "lost_sales": expected_lost_sales[k],
+            "stockouts": stockout_probability[k],
+            "inventory": expected_inventory[k],
+            'waste': 0
+        } for k, Q_transfer in enumerate(quantities)}
+
+    def _max_chunk_size(self, daily_demand) -> int:
+        return max(1, self.settings.max_batch_elements // daily_demand.size)
+
+    def _evaluate_quantities_batched(self, lead_time_vector, calendar, demand_scenarios,
+                                     max_value_to_transfer=None) -> dict:
+        # evaluates chunks of consecutive candidate quantities and stops after the chunk that contains the stopping
+        # point, chunks double in size up to the bound given by max_batch_elements
+        daily_demand, in_forecast, incoming = self._recursion_inputs(lead_time_vector, calendar,
+                                                                     demand_scenarios)
+        max_chunk_size = self._max_chunk_size(daily_demand)
+        last_step = self._last_step(max_value_to_transfer)
+
+        results_by_transfer = {}
+        first_step = 0
+        chunk_size = 8
+        while True:
+            chunk_size = min(chunk_size, max_chunk_size)
+            if last_step is not None:
+                chunk_size = max(1, min(chunk_size, last_step - first_step + 1))
+            quantities = [k * self._step_size for k in range(first_step, first_step + chunk_size)]
+            chunk_results = self._run_inventory_recursion(quantities, daily_demand, in_forecast, incoming)
+            for Q_transfer in quantities:
+                results_by_transfer[Q_transfer] = chunk_results[Q_transfer]
+                if self._is_stopping_point(Q_transfer, chunk_results[Q_transfer]['stockouts'],
+                                           max_value_to_transfer):
+                    return results_by_transfer
+            first_step += chunk_size
+            chunk_size *= 2
+
+    def _evaluate_quantities_by_search(self, lead_time_vector, calendar, demand_scenarios,
+                                       max_value_to_transfer=None) -> dict:
+        # under common random numbers the stockout probability is monotone in the transferred quantity, so the
+        # stopping point is bracketed with galloping steps and located by bisection, then the curve is filled in on
+        # every quantity up to it
+        daily_demand, in_forecast, incoming = self._recursion_inputs(lead_time_vector, calendar,
+                                                                     demand_scenarios)
+        last_step = self._last_step(max_value_to_transfer)
+        evaluated = {}
+
+        def is_stopping_step(k):
+            Q_transfer = k * self._step_size
+            if Q_transfer not in evaluated:
+                evaluated.update(self._run_inventory_recursion([Q_transfer], daily_demand, in_forecast, incoming))
+            return self._is_stopping_point(Q_transfer, evaluated[Q_transfer]['stockouts'], max_value_to_transfer)
+
+        # galloping: the stopping step lies in (lower, upper]
+        lower, upper = -1, 0
+        while not is_stopping_step(upper):
+            lower, upper = upper, 2 * upper + 1
+            if last_step is not None:
+                upper = min(upper, last_step)
+        # bisection
+        while upper - lower > 1:
+            middle = (lower + upper) // 2
+            if is_stopping_step(middle):
+                upper = middle
+            else:
+                lower = middle
+        logger.debug(f"stopping point found at {upper * self._step_size} after {len(evaluated)} recursions")
+
+        quantities = [k * self._step_size for k in range(upper + 1)]
+        missing = [Q_transfer for Q_transfer in quantities if Q_transfer not in evaluated]
+        max_chunk_size = self._max_chunk_size(daily_demand)
+        for start in range(0, len(missing), max_chunk_size):
+            evaluated.update(self._run_inventory_recursion(missing[start:start + max_chunk_size], daily_demand,
+                                                           in_forecast, incoming))
+        return {Q_transfer: evaluated[Q_transfer] for Q_transfer in quantities}
 
     @property
     def stockout_units_by_quantity(self) -> dict:
@@ -163,8 +506,193 @@ class NonPerishableInventorySimulator(Simulator):
         return self._wasted_units_by_quantity
 
 
+class AnalyticInventorySimulator(NonPerishableInventorySimulator):
+    """
+    Closed form evaluation of the non perishable simulation for products with a normal forecast error, a weighted
+    discrete lead time and no incoming inventory within the planning horizon. Without receptions the lost sales of a
+    sample are max(0, D - I), D being its cumulative demand up to the lead time and I the initial inventory, so the
+    expected lost sales and the stockout probability are a mixture, weighted by the lead time probabilities, of normal
+    loss functions and normal tails over the moments of the cumulative demand.
+
+    The cumulative demand is taken as normal, with the moments of the truncated daily demands, which it is not: the
+    curves are an approximation that underestimates the lost sales in the tail and can stop a step earlier than the
+    simulation, so it is only used when SimulationSettings.analytic asks for it.
+    """
+
+    @staticmethod
+    def is_eligible(product: Product) -> bool:
+        lead_time_model = select_supplier(product).lead_time_model
+        if (product.forecast_error_model.get('distribution', None) != 'NORM'
+                or lead_time_model.get('distribution', None) != 'WEIGHTED_DISCRETE'
+                or len(lead_time_model.get('prob_value_pairs', {})) == 0):
+            return False
+        lead_times = [float(k) for k in lead_time_model['prob_value_pairs'].keys()]
+        calendar = ProductCalendar.from_product(product).window(
+            int(max(lead_times) + product.days_to_next_review) + 1)
+        return not calendar.incoming_inventory.any()
+
+    def simulate(self, max_value_to_transfer: int = None, sample_size: int = DEFAULT_SAMPLE_SIZE):
+        results_by_transfer = self._evaluate_quantities_analytically(max_value_to_transfer)
+        self._stockout_units_by_quantity = {k: float(v['lost_sales']) for k, v in results_by_transfer.items()}
+        self._wasted_units_by_quantity = {k: float(v['waste']) for k, v in results_by_transfer.items()}
+        if self.settings.analytic_cross_check:
+            self._cross_check(max_value_to_transfer, sample_size)
+
+    def _cumulative_demand_moments(self):
+        # probability of each lead time and mean and standard deviation of the demand counted up to it
+        lead_times, probabilities = self.lead_time_generator.distribution(0)
+        lead_times = lead_times + self.product.days_to_next_review
+        calendar = self.calendar.window(int(max(lead_times)) + 1)
+
+        means, variances = self.forecast_error_generator.moments(calendar.forecast)
+        selling = calendar.in_forecast & calendar.selling_days
+        means, variances = means * selling, variances * selling
+        # the last day of the horizon is not counted, as in the simulation
+        counted = calendar.in_forecast.copy()
+        counted[-1] = False
+        reached = (np.arange(len(calendar))[None, :] <= lead_times[:, None]) & counted
+        return probabilities, reached @ means, np.sqrt(reached @ variances), reached.any(axis=1)
+
+    def _evaluate_quantities_analytically(self, max_value_to_transfer=None) -> dict:
+        probabilities, means, deviations, any_counted = self._cumulative_demand_moments()
+        direction = 1 if self._node_type == 1 else -1
+        random = deviations > 0
+        scale = np.where(random, deviations, 1)
+
+        results_by_transfer = {}
+        first_step = 0
+        chunk_size = 64
+        while True:
+            quantities = np.arange(first_step, first_step + chunk_size) * self._step_size
+            inventory = self.product.current_inventory - direction * quantities[:, None]
+            z = (inventory - means) / scale
+            lost_sales = np.where(random, scale * (np.exp(-z ** 2 / 2) / np.sqrt(2 * np.pi) - z * sp.special.ndtr(-z)),
+                                  np.maximum(0, means - inventory))
+            # demand is integer, so a sample stocks out when it exceeds the inventory by at least one unit
+            stockouts = np.where(random, sp.special.ndtr(-z - 0.5 / scale), means > inventory)
+            expected_lost_sales = (lost_sales * any_counted) @ probabilities
+            stockout_probability = (stockouts * any_counted) @ probabilities
+            for k, Q_transfer in enumerate(quantities):
+                Q_transfer = int(Q_transfer)
+                results_by_transfer[Q_transfer] = {
+                    "lost_sales": expected_lost_sales[k],
+                    "stockouts": stockout_probability[k],
+                    'waste': 0
+                }
+                if self._is_stopping_point(Q_transfer, stockout_probability[k], max_value_to_transfer):
+                    return results_by_transfer
+            first_step += chunk_size
+
+    def _cross_check(self, max_value_to_transfer, sample_size):
+        simulator = NonPerishableInventorySimulator(self.product, self._node_type == 1, self.settings,
+                                                    self.random_streams)
+        simulator.simulate(max_value_to_transfer=max_value_to_transfer, sample_size=sample_size)
+        quantities = [Q for Q in self._stockout_units_by_quantity if Q in simulator.stockout_units_by_quantity]
+        differences = [abs(self._stockout_units_by_quantity[Q] - simulator.stockout_units_by_quantity[Q])
+                       for Q in quantities]
+        logger.info(f"Product {self.product.sku}: the closed form curve has {len(self._stockout_units_by_quantity)} "
+                    f"quantities and the simulated one {len(simulator.stockout_units_by_quantity)}, the largest "
+                    f"difference in lost sales over the {len(quantities)} common quantities is {max(differences)}")
+
+
+class PairedInventorySimulator:
+    """
+    Simulates the origin and the destination of a product together. Both nodes map the same uniforms, laid on a
+    shared calendar that starts on the earliest of their first forecast dates, through their own lead time and demand
+    distributions, so the noise of their curves is positively correlated and the comparison between them needs fewer
+    samples. Nodes computed in closed form are evaluated on their own.
+    """
+
+    def __init__(self, origin_product: Product, destination_product: Product, settings: SimulationSettings = None,
+                 random_streams: RandomStreams = None):
+        self.settings = settings if settings is not None else SimulationSettings()
+        self.random_streams = random_streams
+        self.simulators = {
+            'origin': SimulationsFactory.get_simulator(origin_product, True, self.settings, random_streams),
+            'destination': SimulationsFactory.get_simulator(destination_product, False, self.settings,
+                                                            random_streams)}
+        self.sampling = SamplingStrategies.get_strategy_by_code(self.settings.sampling)
+        self._random_state = np.random if random_streams is None else random_streams.generator(
+            origin_product.warehouse, origin_product.sku, PAIRED)
+        self._curves = None
+
+    def _simulated_nodes(self) -> List[str]:
+        return [node for node, simulator in self.simulators.items()
+                if not isinstance(simulator, AnalyticInventorySimulator)]
+
+    def _uniforms(self, sample_size: int, columns: int):
+        return np.column_stack([self.sampling.sampler.uniforms(sample_size, self._random_state)
+                                for _ in range(columns)])
+
+    def _draw_scenarios(self, sample_size: int) -> dict:
+        if self.sampling is SamplingStrategies.ANTITHETIC:
+            sample_size += sample_size % 2
+        nodes = self._simulated_nodes()
+        if len(nodes) == 0:
+            return {}
+        start_date = min(self.simulators[node].calendar.start_date for node in nodes)
+        offsets = {node: int((self.simulators[node].calendar.start_date - start_date).astype(int)) for node in nodes}
+        # enough days for the longest lead time either node can draw
+        horizon_length = max(offsets[node] + int(max(self.simulators[node].lead_time_generator.distribution(0)[0])
+                                                 + self.simulators[node].product.days_to_next_review) + 1
+                             for node in nodes)
+        lead_time_uniforms = self._uniforms(sample_size, 1)[:, 0]
+        demand_uniforms = self._uniforms(sample_size, horizon_length)
+        return {node: self.simulators[node].scenarios_from_uniforms(lead_time_uniforms,
+                                                                    demand_uniforms[:, offsets[node]:])
+                for node in nodes}
+
+    def draw_scenarios(self, sample_size: int = DEFAULT_SAMPLE_SIZE) -> dict:
+        """
+        Scenarios of each simulated node, redrawn together with the largest sample size any of them needs for a 2%
+        halfwidth on its expected demand
+        """
+        scenarios = self._draw_scenarios(sample_size)
+        required_sample_sizes = []
+        for node, (lead_time_vector, calendar, demand_scenarios) in scenarios.items():
+            simulator = self.simulators[node]
+            total_demand = simulator._total_demand(lead_time_vector, calendar, demand_scenarios)
+            interval = simulator._demand_interval(total_demand)
+            if interval[0] != 0 and interval[1] / interval[0] * 100 >= 2:
+                required_sample_sizes.append(simulator._required_sample_size(total_demand, interval[0] * 0.02))
+        if len(required_sample_sizes) > 0:
+            sample_size = max(required_sample_sizes)
+            if self.settings.sequential_sampling:
+                sample_size = min(sample_size, self.settings.max_sample_size)
+            logger.warning(f"the sample size was increased to {sample_size}")
+            scenarios = self._draw_scenarios(sample_size)
+        return scenarios
+
+    def simulate(self, sample_size: int = DEFAULT_SAMPLE_SIZE):
+        scenarios = self.draw_scenarios(sample_size)
+        origin, destination = self.simulators['origin'], self.simulators['destination']
+        if 'origin' in scenarios:
+            origin.simulate_scenarios(*scenarios['origin'])
+        else:
+            origin.simulate(sample_size=sample_size)
+        # quantities beyond the largest one the origin can send are never used by the model
+        max_value_to_transfer = max(origin.stockout_units_by_quantity.keys())
+        if 'destination' in scenarios:
+            destination.simulate_scenarios(*scenarios['destination'], max_value_to_transfer=max_value_to_transfer)
+        else:
+            destination.simulate(max_value_to_transfer=max_value_to_transfer, sample_size=sample_size)
+        self._curves = {node: {'lost_sales': simulator.stockout_units_by_quantity,
+                               'waste': simulator.wasted_units_by_quantity}
+                        for node, simulator in self.simulators.items()}
+
+    @property
+    def curves(self) -> Dict[str, dict]:
+        """
+        lost sales and waste curves by transferred quantity of the origin and the destination
+        """
+        if self._curves is None:
+            self.simulate()
+        return self._curves
+
+
 class SimulationTypes(Enum):
     NON_PERISHABLE = ('NP', 'Fixed Term Perishable', NonPerishableInventorySimulator)
+    NON_PERISHABLE_ANALYTIC = ('NP_ANALYTIC', 'Non perishable in closed form', AnalyticInventorySimulator)
 
     def __init__(self, code, description, simulator):
         self._code = code
@@ -193,13 +721,187 @@ class SimulationTypes(Enum):
 
 class SimulationsFactory:
     @staticmethod
-    def get_simulator(product: Product, is_origin: bool):
+    def get_simulator(product: Product, is_origin: bool, settings: SimulationSettings = None,
+                      random_streams: RandomStreams = None):
         if len(product.lots_expiration_by_date) == 0:
+            if settings is not None and settings.analytic and AnalyticInventorySimulator.is_eligible(product):
+                logger.info(f"Computing closed form curves for non perishable product {product.sku}")
+                return SimulationTypes.get_simulator_by_code('NP_ANALYTIC')(product, is_origin, settings,
+                                                                            random_streams)
             logger.info(f"Running simulation for non perishable product {product.sku}")
-            return SimulationTypes.get_simulator_by_code('NP')(product, is_origin)
+            return SimulationTypes.get_simulator_by_code('NP')(product, is_origin, settings, random_streams)
         raise ValueError("Simulation type not supported")
 
 
+class WarehouseInventorySimulator:
+    """
+    Simulates every product of a warehouse together. The scenarios of each product are drawn by its own simulator,
+    then chunks of products are padded onto a shared day axis, aligned on the first date of each forecast, and on a
+    shared sample axis, and the inventory recursion runs over (sku x quantity x sample) accumulators, one day at a
+    time, for all of them at once.
+    """
+
+    def __init__(self, products: List[Product], is_origin: bool, settings: SimulationSettings = None,
+                 max_values_to_transfer: Dict[str, int] = None, random_streams: RandomStreams = None):
+        self.products = products
+        self.random_streams = random_streams
+        self.is_origin = is_origin
+        self.settings = settings if settings is not None else SimulationSettings()
+        self.max_values_to_transfer = max_values_to_transfer if max_values_to_transfer is not None else {}
+        self._curves = None
+        self._skipped = {}
+
+    def simulate(self, sample_size: int = DEFAULT_SAMPLE_SIZE):
+        scenarios = []
+        self._curves = {}
+        self._skipped = {}
+        for product in self.products:
+            try:
+                simulator = SimulationsFactory.get_simulator(product, self.is_origin, self.settings,
+                                                             self.random_streams)
+                if isinstance(simulator, AnalyticInventorySimulator):
+                    # closed form curves do not take part in the batched recursion
+                    simulator.simulate(max_value_to_transfer=self.max_values_to_transfer.get(product.sku),
+                                       sample_size=sample_size)
+                    self._curves[product.sku] = {'lost_sales': simulator.stockout_units_by_quantity,
+                                                 'waste': simulator.wasted_units_by_quantity}
+                    continue
+                lead_time_vector, calendar, demand_scenarios = simulator.draw_scenarios(sample_size)
+                simulator._control = simulator._control_variate(lead_time_vector, calendar, demand_scenarios)
+                scenarios.append((simulator, lead_time_vector, calendar, demand_scenarios))
+            except ValueError as e:
+                self._skipped[product.sku] = str(e)
+
+        # products with similar sample sizes go together so that little of each chunk is padding
+        scenarios.sort(key=lambda scenario: -len(scenario[1]))
+        first = 0
+        while first < len(scenarios):
+            # a chunk holds as many products as fit in max_batch_elements, and at least one
+            size, elements = 0, 0
+            while first + size < len(scenarios):
+                _, lead_time_vector, _, demand_scenarios = scenarios[first + size]
+                elements += demand_scenarios.size
+                if size > 0 and (elements > self.settings.max_batch_elements
+                                 or 2 * len(lead_time_vector) < len(scenarios[first][1])):
+                    break
+                size += 1
+            self._curves.update(self._simulate_chunk(scenarios[first:first + size]))
+            first += size
+
+    def _simulate_chunk(self, scenarios) -> dict:
+        n_skus = len(scenarios)
+        sample_sizes = np.array([len(lead_time_vector) for _, lead_time_vector, _, _ in scenarios])
+        horizon_lengths = np.array([len(calendar) for _, _, calendar, _ in scenarios])
+        sample_size, planning_horizon_length = sample_sizes.max(), horizon_lengths.max()
+
+        # (day x sku x sample) demand, zero after the lead time of each sample and on the padding
+        daily_demand = np.zeros((planning_horizon_length, n_skus, sample_size))
+        moves = np.zeros((planning_horizon_length, n_skus), dtype=bool)
+        incoming = np.zeros((planning_horizon_length, n_skus))
+        valid_samples = np.arange(sample_size) < sample_sizes[:, None]
+        for k, (_, lead_time_vector, calendar, demand_scenarios) in enumerate(scenarios):
+            horizon = np.arange(len(calendar))
+            daily_demand[:len(calendar), k, :sample_sizes[k]] = (
+                    demand_scenarios * (horizon <= lead_time_vector[:, None])).T
+            moves[:len(calendar), k] = calendar.in_forecast
+            incoming[:len(calendar), k] = calendar.incoming_inventory
+        # the last day of each product's horizon is left out of the lost sales, as in the single product simulation
+        counted = moves & (np.arange(planning_horizon_length)[:, None] < horizon_lengths - 1)
+
+        simulators = [simulator for simulator, _, _, _ in scenarios]
+        step_sizes = np.array([simulator._step_size for simulator in simulators])
+        current_inventory = np.array([simulator.product.current_inventory for simulator in simulators])
+        direction = 1 if self.is_origin else -1
+
+        results_by_transfer = [{} for _ in scenarios]
+        # products that have not reached their stopping point, the arrays below only keep their rows
+        active = np.arange(n_skus)
+        first_step = 0
+        chunk_size = 8
+        while len(active) > 0:
+            chunk_size = min(chunk_size, max(1, self.settings.max_batch_elements // (len(active) * sample_size)))
+            steps = np.arange(first_step, first_step + chunk_size)
+            inventory = (np.zeros((len(active), chunk_size, sample_size)) + current_inventory[:, None, None]
+                         - direction * (steps[None, :] * step_sizes[:, None])[:, :, None])
+            total_lost_sales = np.zeros(inventory.shape)
+            daily_lost_sales = np.empty(inventory.shape)
+
+            for i in np.flatnonzero(moves.any(axis=1)):
+                day_moves = moves[i, :, None, None]
+                np.subtract(daily_demand[i, :, None, :], inventory, out=daily_lost_sales)
+                np.maximum(daily_lost_sales, 0, out=daily_lost_sales)
+                if day_moves.all():
+                    # max(0, inventory - demand) without another comparison pass
+                    inventory -= daily_demand[i, :, None, :]
+                    inventory += daily_lost_sales
+                else:
+                    daily_lost_sales *= day_moves
+                    inventory = np.where(day_moves, np.maximum(0, inventory - daily_demand[i, :, None, :]), inventory)
+                if not counted[i].all():
+                    daily_lost_sales *= counted[i, :, None, None]
+                total_lost_sales += daily_lost_sales
+                inventory += incoming[i, :, None, None]
+
+            valid = valid_samples[:, None, :]
+            n_samples = sample_sizes[:, None]
+            expected_lost_sales = np.sum(total_lost_sales * valid, axis=2) / n_samples
+            for a, k in enumerate(active):
+                if simulators[k]._control is not None:
+                    expected_lost_sales[a] = simulators[k]._expected_lost_sales(
+                        total_lost_sales[a, :, :sample_sizes[a]])
+            # lost sales are never negative, so a sample stocked out exactly when its total is positive
+            stockout_probability = np.sum((total_lost_sales > 0) & valid, axis=2) / n_samples
+            expected_inventory = np.sum(inventory * valid, axis=2) / n_samples
+
+            still_active = []
+            for a, k in enumerate(active):
+                simulator = simulators[k]
+                max_value_to_transfer = self.max_values_to_transfer.get(simulator.product.sku)
+                for j, step in enumerate(steps):
+                    Q_transfer = int(step) * simulator._step_size
+                    results_by_transfer[k][Q_transfer] = {
+                        "lost_sales": expected_lost_sales[a, j],
+                        "stockouts": stockout_probability[a, j],
+                        "inventory": expected_inventory[a, j],
+                        'waste': 0
+                    }
+                    if simulator._is_stopping_point(Q_transfer, stockout_probability[a, j], max_value_to_transfer):
+                        break
+                else:
+                    still_active.append(a)
+            if len(still_active) < len(active):
+                active = active[still_active]
+                daily_demand = daily_demand[:, still_active]
+                moves, counted, incoming = moves[:, still_active], counted[:, still_active], incoming[:, still_active]
+                valid_samples, sample_sizes = valid_samples[still_active], sample_sizes[still_active]
+                step_sizes, current_inventory = step_sizes[still_active], current_inventory[still_active]
+            first_step += chunk_size
+            chunk_size *= 2
+
+        return {simulator.product.sku: {
+            'lost_sales': {k: float(v['lost_sales']) for k, v in results.items()},
+            'waste': {k: float(v['waste']) for k, v in results.items()}
+        } for simulator, results in zip(simulators, results_by_transfer)}
+
+    @property
+    def curves(self) -> Dict[str, dict]:
+        """
+        lost sales and waste curves by transferred quantity of every simulated product, indexed by sku
+        """
+        if self._curves is None:
+            self.simulate()
+        return self._curves
+
+    @property
+    def skipped(self) -> Dict[str, str]:
+        """
+        reason why each product that could not be simulated was skipped, indexed by sku
+        """
+        if self._curves is None:
+            self.simulate()
+        return self._skipped
+
+
 if __name__ == '__main__':
     # forecast_error_model = {'distribution': 'DISC', 'values': [0,1,3,4,4,5,5]}
     # forecast_error_model = {'distribution': 'NORM', 'mu': 10, 'sigma': 20.1}
@@ -1,42 +1,224 @@
+from concurrent.futures import ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from typing import List
+
 from app.src.classes import TranshipmentProblem, Product
 from app.src.loggin import logger
-from app.src.simulator import SimulationsFactory
+from app.src.simulator import SimulationsFactory, SimulationSettings, WarehouseInventorySimulator, \
+    PairedInventorySimulator, DEFAULT_SAMPLE_SIZE
+from app.src.simulation_cache import SimulationCache
+from app.src.random_streams import RandomStreams
+from app.src.transfer_model import TransferOptions, HighsTransferModel, KnapsackTransferModel, OptimizationBackends, \
+    BIG_M
 import pulp as plp
 from highsbox import highs_bin_path
 
-BIG_M = 1000000
+
+def simulate_product(product: Product, is_origin: bool, settings: SimulationSettings, random_streams: RandomStreams,
+                     max_value_to_transfer: int = None) -> dict:
+    """
+    Simulates a single product on its own random streams, runs in the worker processes of
+    Solver.get_products_params_in_parallel as well as in the main one
+    """
+    simulator = SimulationsFactory.get_simulator(product, is_origin=is_origin, settings=settings,
+                                                 random_streams=random_streams)
+    simulator.simulate(max_value_to_transfer=max_value_to_transfer)
+    return {
+        'lost_sales': simulator.stockout_units_by_quantity
+        , 'waste': simulator.wasted_units_by_quantity
+    }
+
+
+def simulate_pair(origin_product: Product, destination_product: Product, settings: SimulationSettings,
+                  random_streams: RandomStreams) -> dict:
+    """
+    Simulates the origin and destination of a product on common random numbers, runs in the worker processes of
+    Solver.get_paired_products_params as well as in the main one
+    """
+    return PairedInventorySimulator(origin_product, destination_product, settings, random_streams).curves
 
 
 class Solver:
-    def __init__(self, transhipment_problem: TranshipmentProblem):
+    def __init__(self, transhipment_problem: TranshipmentProblem, simulation_settings: SimulationSettings = None,
+                 simulation_cache: SimulationCache = None, random_seed: int = 0, backend: str = 'PULP'):
         self.transhipment_problem = transhipment_problem
+        self.backend = OptimizationBackends.get_backend_by_code(backend)
+        self.random_streams = RandomStreams(random_seed)
+        self.simulation_settings = simulation_settings
+        self.simulation_cache = simulation_cache
         self.model_products = {'origin': {}, 'destination': {}}
         self.valid_products = set()
         self._recommendations = {}
 
     def get_products_params(self):
-        skip_list = []
-        for _, product in self.transhipment_problem.origin_products.items():
-            try:
-                simulator = SimulationsFactory.get_simulator(product, is_origin=True)
-                self.model_products['origin'][product.sku] = {
-                    'lost_sales': simulator.stockout_units_by_quantity
-                    , 'waste': simulator.wasted_units_by_quantity
-                }
-            except ValueError as e:
-                logger.warning(f"Product {product.sku} was skipped because {str(e)}")
-                skip_list.append(product.sku)
-        for _, product in self.transhipment_problem.destination_products.items():
-            if product.sku in skip_list:
-                continue
-            try:
-                simulator = SimulationsFactory.get_simulator(product, is_origin=False)
-                self.model_products['destination'][product.sku] = {
-                    'lost_sales': simulator.stockout_units_by_quantity
-                    , 'waste': simulator.wasted_units_by_quantity
-                }
-            except ValueError as e:
-                logger.warning(f"Product {product.sku} was skipped because {str(e)}")
+        if self.simulation_settings is not None and self.simulation_settings.paired:
+            self.get_paired_products_params()
+        elif self.simulation_settings is not None and self.simulation_settings.warehouse_batched:
+            self.get_warehouse_products_params()
+        elif self.simulation_settings is not None and self.simulation_settings.max_workers > 1:
+            self.get_products_params_in_parallel()
+        else:
+            skip_list = []
+            for _, product in self.transhipment_problem.origin_products.items():
+                try:
+                    self.model_products['origin'][product.sku] = self._simulate(product, is_origin=True)
+                except ValueError as e:
+                    logger.warning(f"Product {product.sku} was skipped because {str(e)}")
+                    skip_list.append(product.sku)
+            for _, product in self.transhipment_problem.destination_products.items():
+                if product.sku in skip_list:
+                    continue
+                try:
+                    self.model_products['destination'][product.sku] = self._simulate(
+                        product, is_origin=False, max_value_to_transfer=self._max_value_to_transfer(product.sku))
+                except ValueError as e:
+                    logger.warning(f"Product {product.sku} was skipped because {str(e)}")
+        if self.simulation_cache is not None:
+            logger.info(f"Simulation cache: {self.simulation_cache.stats}")
+
+    def _max_value_to_transfer(self, sku: str):
+        # quantities beyond the largest one the origin can send are never used by the model
+        if sku not in self.model_products['origin']:
+            return None
+        return max(self.model_products['origin'][sku]['lost_sales'].keys())
+
+    def _cache_key(self, product: Product, is_origin: bool, max_value_to_transfer: int = None):
+        return SimulationCache.key(product, is_origin, self.simulation_settings, DEFAULT_SAMPLE_SIZE,
+                                   self.random_streams.identifier(product.warehouse, product.sku),
+                                   max_value_to_transfer)
+
+    def _simulate(self, product: Product, is_origin: bool, max_value_to_transfer: int = None) -> dict:
+        key = None
+        if self.simulation_cache is not None:
+            key = self._cache_key(product, is_origin, max_value_to_transfer)
+            curves = self.simulation_cache.get(key)
+            if curves is not None:
+                return curves
+        curves = simulate_product(product, is_origin, self.simulation_settings, self.random_streams,
+                                  max_value_to_transfer)
+        if key is not None:
+            self.simulation_cache.put(key, curves)
+        return curves
+
+    def get_products_params_in_parallel(self):
+        # the destination of a product is only submitted once its origin has finished, so that origin failures keep
+        # suppressing the destination run and the origin curve can bound the destination one
+        settings = self.simulation_settings
+        destination_products = self.transhipment_problem.destination_products
+        with ProcessPoolExecutor(max_workers=settings.max_workers) as executor:
+            pending = {}
+            finished = []
+
+            def submit(product: Product, is_origin: bool, max_value_to_transfer: int = None):
+                node = 'origin' if is_origin else 'destination'
+                key = None
+                if self.simulation_cache is not None:
+                    key = self._cache_key(product, is_origin, max_value_to_transfer)
+                    curves = self.simulation_cache.get(key)
+                    if curves is not None:
+                        finished.append((product.sku, node, curves))
+                        return
+                future = executor.submit(simulate_product, product, is_origin, settings, self.random_streams,
+                                         max_value_to_transfer)
+                pending[future] = (product.sku, node, key)
+
+            for _, product in self.transhipment_problem.origin_products.items():
+                submit(product, True)
+            for _, product in destination_products.items():
+                if product.sku not in self.transhipment_problem.origin_products:
+                    submit(product, False)
+
+            while len(pending) > 0 or len(finished) > 0:
+                while len(finished) > 0:
+                    sku, node, curves = finished.pop()
+                    self.model_products[node][sku] = curves
+                    if node == 'origin' and sku in destination_products:
+                        submit(destination_products[sku], False, self._max_value_to_transfer(sku))
+                if len(pending) == 0:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    sku, node, key = pending.pop(future)
+                    try:
+                        curves = future.result()
+                    except ValueError as e:
+                        logger.warning(f"Product {sku} was skipped because {str(e)}")
+                        continue
+                    if key is not None:
+                        self.simulation_cache.put(key, curves)
+                    finished.append((sku, node, curves))
+
+    def get_paired_products_params(self):
+        # products found in a single node have nothing to share and are simulated on their own
+        origin_products = self.transhipment_problem.origin_products
+        destination_products = self.transhipment_problem.destination_products
+        tasks = {}
+        for sku, product in origin_products.items():
+            if sku in destination_products:
+                tasks[(sku, 'pair')] = (simulate_pair, product, destination_products[sku], self.simulation_settings,
+                                        self.random_streams)
+            else:
+                tasks[(sku, 'origin')] = (simulate_product, product, True, self.simulation_settings,
+                                          self.random_streams)
+        for sku, product in destination_products.items():
+            if sku not in origin_products:
+                tasks[(sku, 'destination')] = (simulate_product, product, False, self.simulation_settings,
+                                               self.random_streams)
+
+        def store(task, result):
+            sku, node = task
+            if node == 'pair':
+                for pair_node, curves in result.items():
+                    self.model_products[pair_node][sku] = curves
+            else:
+                self.model_products[node][sku] = result
+
+        if self.simulation_settings.max_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.simulation_settings.max_workers) as executor:
+                futures = {executor.submit(*arguments): task for task, arguments in tasks.items()}
+                for future in as_completed(futures):
+                    try:
+                        store(futures[future], future.result())
+                    except ValueError as e:
+                        logger.warning(f"Product {futures[future][0]} was skipped because {str(e)}")
+        else:
+            for task, (function, *arguments) in tasks.items():
+                try:
+                    store(task, function(*arguments))
+                except ValueError as e:
+                    logger.warning(f"Product {task[0]} was skipped because {str(e)}")
+
+    def get_warehouse_products_params(self):
+        skipped = self._simulate_warehouse(list(self.transhipment_problem.origin_products.values()), is_origin=True)
+        self._simulate_warehouse([product for _, product in self.transhipment_problem.destination_products.items()
+                                  if product.sku not in skipped], is_origin=False)
+
+    def _simulate_warehouse(self, products: list, is_origin: bool) -> dict:
+        # every product draws from its own streams, so the warehouse engine shares cache entries with the others
+        node = 'origin' if is_origin else 'destination'
+        keys = {}
+        if self.simulation_cache is not None:
+            missing = []
+            for product in products:
+                keys[product.sku] = self._cache_key(product, is_origin, self._max_value_to_transfer(product.sku))
+                curves = self.simulation_cache.get(keys[product.sku])
+                if curves is None:
+                    missing.append(product)
+                else:
+                    self.model_products[node][product.sku] = curves
+            products = missing
+
+        simulator = WarehouseInventorySimulator(
+            products, is_origin=is_origin, settings=self.simulation_settings,
+            max_values_to_transfer={product.sku: self._max_value_to_transfer(product.sku) for product in products
+                                    if not is_origin and product.sku in self.model_products['origin']},
+            random_streams=self.random_streams)
+        self.model_products[node].update(simulator.curves)
+        for sku, reason in simulator.skipped.items():
+            logger.warning(f"Product {sku} was skipped because {reason}")
+        if self.simulation_cache is not None:
+            for sku, curves in simulator.curves.items():
+                self.simulation_cache.put(keys[sku], curves)
+        return simulator.skipped
 
     def solve(self):
         self.get_products_params()
@@ -50,9 +232,31 @@ class Solver:
         return self._recommendations
 
     def optimize(self):
+        # only the options that are not dominated become binaries
+        options = TransferOptions.from_curves(self.model_products, list(set(self.valid_products)),
+                                              self.transhipment_problem).prune_dominated()
+        if KnapsackTransferModel.is_eligible(options, self.transhipment_problem.mandatory_closed_transport_units):
+            model = KnapsackTransferModel(options, self.transhipment_problem.capacity_in_transport_units)
+            self._recommendations = model.solve()
+        elif self.backend is OptimizationBackends.HIGHS:
+            self._optimize_with_highs(options)
+        else:
+            self._optimize_with_pulp(options)
+
+    def _optimize_with_highs(self, options: TransferOptions):
+        model = HighsTransferModel(options, self.transhipment_problem.capacity_in_transport_units,
+                                   self.transhipment_problem.mandatory_closed_transport_units)
+        self._recommendations = model.solve()
+
+    def _optimize_with_pulp(self, options: TransferOptions):
+        self._recommendations = self._solve_with_pulp(options, self.transhipment_problem.capacity_in_transport_units,
+                                                      self.transhipment_problem.mandatory_closed_transport_units)
+
+    def _solve_with_pulp(self, options: TransferOptions, capacity_in_transport_units: float,
+                         mandatory_closed_transport_units: float) -> dict:
 
         # enumerate sets
-        products = list(set(self.valid_products))
+        products = list(options.skus)
 
         q_vals = {}
         for i in products:
@@ -63,7 +267,7 @@ class Solver:
             else:
                 q_vals[i] = list(self.model_products['destination'][i]['lost_sales'].keys())
 
-        valid_tuples = set([(i, j) for i in q_vals.keys() for j in q_vals[i]])
+        valid_tuples = options.tuples()
 
         warehouses = ['origin', 'destination']
 
@@ -127,26 +331,71 @@ class Solver:
 
         # respect the mandatory closed pallets
         transhipment_model += plp.lpSum(
-            [pallets[i] for i in products]) >= self.transhipment_problem.mandatory_closed_transport_units, "Respect the mandatory closed pallets"
+            [pallets[i] for i in products]) >= mandatory_closed_transport_units, "Respect the mandatory closed pallets"
 
         # respect the capacity in transport units
         transhipment_model += plp.lpSum([x[(i, j)] * j * 1 / (lot_size[i] * lots_per_pallet[i]) for i, j in
-                                         valid_tuples]) <= self.transhipment_problem.capacity_in_transport_units, "Respect the capacity in transport units"
+                                         valid_tuples]) <= capacity_in_transport_units, "Respect the capacity in transport units"
 
-        # solve the model
-        transhipment_model.solve(plp.HiGHS_CMD(path=highs_bin_path()))
+        # solve the model, without a relative gap since it would be measured against the BIG_M of left behind mandatory products
+        transhipment_model.solve(plp.HiGHS_CMD(path=highs_bin_path(), gapRel=0, gapAbs=1e-6))
 
         if plp.LpStatus[transhipment_model.status] == 'Optimal':
 
             if sum([left_behind[i].varValue for i in products]) > 0:
                 logger.warning("Some mandatory products could not be transshipped")
 
+            recommendations = {}
             for i, j in valid_tuples:
                 if x[(i, j)].varValue == 1:
-                    self.recommendations[i] = j
+                    recommendations[i] = j
+            return recommendations
         else:
             raise ValueError("The model could not be solved")
 
+    def sweep_capacity(self, capacities: List[float], mandatory_closed: List[float] = None) -> List[dict]:
+        """
+        Cost and recommendations for every capacity in transport units, and every mandatory closed pallets value when
+        given, from the curves simulated once. The points are solved in order by the knapsack model when it applies,
+        otherwise with the backend of the solver: on a single HiGHS model, each one starting from the recommendations
+        of the previous one, or with PuLP, which builds the model again for every point
+        """
+        if len(self.valid_products) == 0:
+            self.get_products_params()
+            self.set_valid_products()
+        options = TransferOptions.from_curves(self.model_products, sorted(self.valid_products),
+                                              self.transhipment_problem).prune_dominated()
+        if mandatory_closed is None:
+            mandatory_closed = [self.transhipment_problem.mandatory_closed_transport_units]
+
+        frontier, model, recommendations = [], None, {}
+        for closed in mandatory_closed:
+            for capacity in capacities:
+                try:
+                    if KnapsackTransferModel.is_eligible(options, closed):
+                        solved = KnapsackTransferModel(options, capacity)
+                        recommendations = solved.solve()
+                        cost = solved.objective_value
+                    elif self.backend is OptimizationBackends.HIGHS:
+                        if model is None:
+                            model = HighsTransferModel(options, capacity, closed)
+                        else:
+                            model.set_capacities(capacity, closed)
+                        recommendations = model.solve(start=recommendations)
+                        cost = model.objective_value
+                    else:
+                        recommendations = self._solve_with_pulp(options, capacity, closed)
+                        cost = options.cost_of(recommendations)
+                except ValueError as e:
+                    logger.warning(f"Capacity {capacity} with {closed} mandatory closed transport units was skipped "
+                                   f"because {str(e)}")
+                    recommendations, cost = {}, None
+                frontier.append({'capacity_in_transport_units': capacity,
+                                 'mandatory_closed_transport_units': closed,
+                                 'cost': cost,
+                                 'recommendations': recommendations})
+        return frontier
+
     def set_valid_products(self):
         # the valid products are those that are both in origin and destination and have quantities to transfer from origin to destination larger than 0
         _products = set(self.model_products['origin'].keys()) & set(self.model_products['destination'].keys())
@@ -156,3 +405,42 @@ class Solver:
 
     def get_recommendations(self):
         return self.recommendations
+
+
+class SolverSession:
+    """
+    Replanning of a lane that keeps the HiGHS transfer model and its recommendations between solves. Each solve updates
+    the kept model with what changed in the options, costs, capacities and products, and starts HiGHS from the last
+    recommendations instead of building and solving the model from nothing.
+    """
+
+    def __init__(self, simulation_settings: SimulationSettings = None, simulation_cache: SimulationCache = None,
+                 random_seed: int = 0):
+        self.simulation_settings = simulation_settings
+        self.simulation_cache = simulation_cache
+        self.random_seed = random_seed
+        self.model = None
+        self.recommendations = {}
+
+    def solve(self, transhipment_problem: TranshipmentProblem, model_products: dict = None) -> dict:
+        """
+        Recommendations of the problem, simulated unless its curves are given in model_products
+        """
+        solver = Solver(transhipment_problem, self.simulation_settings, self.simulation_cache, self.random_seed,
+                        backend=OptimizationBackends.HIGHS.code)
+        if model_products is None:
+            solver.get_products_params()
+        else:
+            solver.model_products = model_products
+        solver.set_valid_products()
+        # the options dominated now are only deactivated, they come back if a later update makes them useful
+        options = TransferOptions.from_curves(solver.model_products, sorted(solver.valid_products),
+                                              transhipment_problem).prune_dominated()
+        if self.model is None:
+            self.model = HighsTransferModel(options, transhipment_problem.capacity_in_transport_units,
+                                            transhipment_problem.mandatory_closed_transport_units)
+        else:
+            self.model.update(options, transhipment_problem.capacity_in_transport_units,
+                              transhipment_problem.mandatory_closed_transport_units)
+        self.recommendations = self.model.solve(start=self.recommendations)
+        return self.recommendations
@@ -0,0 +1,491 @@
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, List
+
+import numpy as np
+import scipy.sparse
+
+from app.src.classes import TranshipmentProblem
+from app.src.loggin import logger
+
+BIG_M = 1000000
+# largest products times pallets table of the knapsack dynamic program
+MAX_DP_CELLS = 10000000
+
+
+@dataclass
+class TransferOptions:
+    """
+    Candidate quantities of the transfer model flattened over its products, one entry per (sku, quantity) binary.
+
+    skus: products of the model
+    product: index in skus of the product of each option
+    quantity: units transferred by each option
+    cost: objective coefficient of each option, the expected lost sales and waste costs at the origin
+    lot_size: units per lot of each product
+    lots_per_pallet: lots per pallet of each product
+    mandatory: whether each product must be transferred
+    """
+    skus: List[str]
+    product: np.ndarray
+    quantity: np.ndarray
+    cost: np.ndarray
+    lot_size: np.ndarray
+    lots_per_pallet: np.ndarray
+    mandatory: np.ndarray
+
+    @staticmethod
+    def from_curves(model_products: dict, products: List[str],
+                    transhipment_problem: TranshipmentProblem) -> 'TransferOptions':
+        product, quantity, cost = [], [], []
+        for k, sku in enumerate(products):
+            origin_product = transhipment_problem.origin_products[sku]
+            origin, destination = model_products['origin'][sku], model_products['destination'][sku]
+            # the quantities are those of the shorter of the two curves
+            if len(origin['lost_sales']) <= len(destination['lost_sales']):
+                quantities = list(origin['lost_sales'].keys())
+            else:
+                quantities = list(destination['lost_sales'].keys())
+            stockout_cost_per_unit = (origin_product.percentage_cost_per_unit_shortage / 100
+                                      * origin_product.current_price_per_unit)
+            waste_cost_per_unit = (origin_product.percentage_cost_per_unit_excess / 100
+                                   * origin_product.current_price_per_unit)
+            product += [k] * len(quantities)
+            quantity += quantities
+            cost += [origin['lost_sales'][j] * stockout_cost_per_unit + origin['waste'][j] * waste_cost_per_unit
+                     for j in quantities]
+        origin_products = [transhipment_problem.origin_products[sku] for sku in products]
+        return TransferOptions(
+            skus=list(products),
+            product=np.array(product, dtype=int),
+            quantity=np.array(quantity),
+            cost=np.array(cost, dtype=float),
+            lot_size=np.array([p.units_per_product_dim for p in origin_products], dtype=float),
+            lots_per_pallet=np.array([p.supplier_dim_to_product_dim_conversion_factor for p in origin_products],
+                                     dtype=float),
+            mandatory=np.array([bool(p.mandatory) for p in origin_products], dtype=bool)
+        )
+
+    def __len__(self):
+        return len(self.quantity)
+
+    @property
+    def lot_usage(self) -> np.ndarray:
+        return self.quantity / self.lot_size[self.product]
+
+    @property
+    def pallet_usage(self) -> np.ndarray:
+        return self.quantity / (self.lot_size * self.lots_per_pallet)[self.product]
+
+    @property
+    def feasible(self) -> np.ndarray:
+        # the lots and pallets rows only admit whole pallets, in closed pallets or not
+        pallet_usage = self.pallet_usage
+        return np.isclose(pallet_usage, np.round(pallet_usage))
+
+    def subset(self, keep: np.ndarray) -> 'TransferOptions':
+        return TransferOptions(skus=self.skus, product=self.product[keep], quantity=self.quantity[keep],
+                               cost=self.cost[keep], lot_size=self.lot_size, lots_per_pallet=self.lots_per_pallet,
+                               mandatory=self.mandatory)
+
+    def tuples(self) -> set:
+        return set((self.skus[k], j.item()) for k, j in zip(self.product, self.quantity))
+
+    def cost_of(self, recommendations: Dict[str, float]) -> float:
+        """
+        Objective value of the transfer MILP at the given recommendations, the cost of their options and BIG_M for every
+        mandatory product that is left behind, transferring less than a lot
+        """
+        skus = {sku: k for k, sku in enumerate(self.skus)}
+        chosen = np.array([recommendations.get(self.skus[k]) == j for k, j in zip(self.product, self.quantity)],
+                          dtype=bool)
+        left_behind = [sku for sku, quantity in recommendations.items()
+                       if self.mandatory[skus[sku]] and quantity < self.lot_size[skus[sku]]]
+        return self.cost[chosen].sum().item() + BIG_M * len(left_behind)
+
+    def prune_dominated(self) -> 'TransferOptions':
+        """
+        Options without the ones that no optimal solution needs. An option is infeasible when its pallet usage is
+        not a whole number of pallets, the lots rows can then be met neither in nor out of closed pallets. A feasible
+        option is dominated by another one of the same product that costs no more, uses no more pallets and, for a
+        mandatory product, transfers at least one lot if the first one does. The mandatory closed pallets do not tell
+        options apart since a product off closed pallets can cover them on its own through the big M of its pallets.
+        """
+        pallet_usage, feasible = self.pallet_usage, self.feasible
+        covers = self.mandatory[self.product] & (self.lot_usage >= 1)
+        keep = np.zeros(len(self), dtype=bool)
+        # sweep the options of each product by pallet usage with the cheapest cost seen so far, over all the options
+        # and over the ones that cover a mandatory product
+        order = np.lexsort((self.cost, pallet_usage, self.product))
+        order = order[feasible[order]]
+        current_product, cheapest, cheapest_covering = -1, np.inf, np.inf
+        for k, product, cost, covering in zip(order, self.product[order], self.cost[order], covers[order]):
+            if product != current_product:
+                current_product, cheapest, cheapest_covering = product, np.inf, np.inf
+            if cost < (cheapest_covering if covering else cheapest):
+                keep[k] = True
+                cheapest = min(cheapest, cost)
+                if covering:
+                    cheapest_covering = min(cheapest_covering, cost)
+        logger.info(f"{len(self) - keep.sum()} of {len(self)} transfer options were pruned, "
+                    f"{len(self) - feasible.sum()} of them infeasible")
+        return self.subset(keep)
+
+
+class HighsTransferModel:
+    """
+    The transfer MILP of Solver.optimize solved in process through the HiGHS python API, with the same variables and
+    constraints as the PuLP model up to the big M constants. Each product brings its closed pallets indicator, pallets,
+    lots and left behind columns, its six rows and one binary per option, added to HiGHS as sparse blocks. The model
+    can then be kept between solves: update() only changes the costs and bounds that moved and adds the products and
+    options that are new, the ones that are gone are deactivated, and solve() can start from known recommendations.
+    """
+
+    def __init__(self, options: TransferOptions, capacity_in_transport_units: float,
+                 mandatory_closed_transport_units: float):
+        try:
+            import highspy
+        except ImportError:
+            raise ImportError("The HIGHS backend requires the highspy package")
+        self._highspy = highspy
+        self.highs = highspy.Highs()
+        self.highs.setOptionValue('output_flag', False)
+        # a relative gap would be measured against the BIG_M of left behind mandatory products
+        self.highs.setOptionValue('mip_rel_gap', 0.0)
+        self.highs.setOptionValue('mip_abs_gap', 1e-6)
+
+        # products are keyed by sku and packing, their columns are y, pallets, lots and left behind and their rows the
+        # allocation, the mandatory transfer, the pallets above and below and the lots above and below
+        self._products = {}
+        self._product_sku = []
+        self._product_lots_per_pallet = np.zeros(0)
+        self._product_columns = np.zeros((0, 4), dtype=int)
+        self._product_rows = np.zeros((0, 6), dtype=int)
+        self._pallets_big_m, self._lots_big_m = np.zeros(0), np.zeros(0)
+        self._max_pallet_usage, self._max_lot_usage = np.zeros(0), np.zeros(0)
+        # options are keyed by product and quantity
+        self._options = {}
+        self._option_product = np.zeros(0, dtype=int)
+        self._option_quantity = np.zeros(0, dtype=int)
+        self._option_column = np.zeros(0, dtype=int)
+        self._option_pallet_usage, self._option_lot_usage = np.zeros(0), np.zeros(0)
+        self._active = np.zeros(0, dtype=bool)
+
+        # the closed pallets and capacity rows, their entries come with the columns
+        self.closed_row, self.capacity_row = 0, 1
+        self._add_rows(2, [], [], [])
+        self.update(options, capacity_in_transport_units, mandatory_closed_transport_units)
+
+    def update(self, options: TransferOptions, capacity_in_transport_units: float,
+               mandatory_closed_transport_units: float):
+        """
+        Turn the model into the one of the given options and capacities
+        """
+        self.set_capacities(capacity_in_transport_units, mandatory_closed_transport_units)
+        infinity = self._highspy.kHighsInf
+        keys = list(zip(options.skus, options.lot_size.tolist(), options.lots_per_pallet.tolist()))
+        self._add_products([k for k, key in enumerate(keys) if key not in self._products], options, keys)
+        products = np.array([self._products[key] for key in keys], dtype=int)
+        product = products[options.product]
+        option_keys = list(zip(product.tolist(), options.quantity.tolist()))
+        new = np.array([key not in self._options for key in option_keys], dtype=bool)
+        self._add_options(product[new], options.quantity[new], options.pallet_usage[new], options.lot_usage[new])
+        index = np.array([self._options[key] for key in option_keys], dtype=int)
+
+        # options missing from the update are fixed to zero, products missing from it need no allocation
+        self._active[:] = False
+        self._active[index] = True
+        self._change_cols_bounds(self._option_column, np.zeros(len(self._active)), self._active.astype(float))
+        self.highs.changeColsCost(len(index), self._option_column[index].astype(np.int32), options.cost.astype(float))
+        allocated = np.zeros(len(self._product_sku))
+        allocated[products] = 1
+        mandatory = np.full(len(self._product_sku), -infinity)
+        mandatory[products[options.mandatory]] = 1
+        self._mandatory = mandatory > 0
+        self._change_rows_bounds(self._product_rows[:, 0], allocated, allocated)
+        self._change_rows_bounds(self._product_rows[:, 1], mandatory, np.full(len(mandatory), infinity))
+        self._change_cols_bounds(self._product_columns[:, 1], np.zeros(len(allocated)),
+                                 np.where(allocated > 0, infinity, 0))
+        self._update_big_m()
+
+    def set_capacities(self, capacity_in_transport_units: float, mandatory_closed_transport_units: float):
+        infinity = self._highspy.kHighsInf
+        self.highs.changeRowBounds(self.closed_row, mandatory_closed_transport_units, infinity)
+        self.highs.changeRowBounds(self.capacity_row, -infinity, capacity_in_transport_units)
+        self.mandatory_closed_transport_units = mandatory_closed_transport_units
+        self._update_big_m()
+
+    def _add_products(self, new: List[int], options: TransferOptions, keys: list):
+        n_new = len(new)
+        for k in new:
+            self._products[keys[k]] = len(self._product_sku)
+            self._product_sku.append(keys[k][0])
+        lots_per_pallet = options.lots_per_pallet[new]
+        self._product_lots_per_pallet = np.concatenate([self._product_lots_per_pallet, lots_per_pallet])
+        for name in ['_pallets_big_m', '_lots_big_m', '_max_pallet_usage', '_max_lot_usage']:
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(n_new)]))
+
+        # y, pallets, lots and left behind, the pallets count towards the mandatory closed pallets
+        ones, zeros = np.ones(n_new), np.zeros(n_new)
+        columns = self._add_columns(np.column_stack([zeros, zeros, zeros, BIG_M * ones]).ravel(),
+                                    np.column_stack([ones, np.full((n_new, 2), np.inf), ones]).ravel(),
+                                    np.full(n_new, self.closed_row), 4 * np.arange(n_new) + 1, ones).reshape(n_new, 4)
+        self._product_columns = np.concatenate([self._product_columns, columns])
+
+        # the rows with their product columns, the option columns and the big M of y come later
+        _, pallets, lots, left_behind = columns.T
+        rows = np.arange(6 * n_new).reshape(n_new, 6)
+        lpp = -lots_per_pallet
+        first_row = self._add_rows(6 * n_new, np.concatenate([rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4],
+                                                              rows[:, 5]]),
+                                   np.concatenate([left_behind, pallets, pallets, lots, lots]),
+                                   np.concatenate([ones, lpp, lpp, lpp, lpp]))
+        self._product_rows = np.concatenate([self._product_rows, first_row + rows])
+
+    def _add_options(self, product: np.ndarray, quantity: np.ndarray, pallet_usage: np.ndarray,
+                     lot_usage: np.ndarray):
+        n_new, first_option = len(product), len(self._option_product)
+        option_rows = self._product_rows[product]
+        option = np.arange(n_new)
+        # allocation, mandatory, pallets above and below, lots above and below and capacity
+        columns = self._add_columns(np.zeros(n_new), np.ones(n_new),
+                                    np.concatenate([*option_rows.T, np.full(n_new, self.capacity_row)]),
+                                    np.tile(option, 7),
+                                    np.concatenate([np.ones(n_new), lot_usage, pallet_usage, pallet_usage,
+                                                    lot_usage, lot_usage, pallet_usage]))
+        for k in range(n_new):
+            self._options[(product[k].item(), quantity[k].item())] = first_option + k
+        self._option_product = np.concatenate([self._option_product, product])
+        self._option_quantity = np.concatenate([self._option_quantity, quantity])
+        self._option_column = np.concatenate([self._option_column, columns])
+        self._option_pallet_usage = np.concatenate([self._option_pallet_usage, pallet_usage])
+        self._option_lot_usage = np.concatenate([self._option_lot_usage, lot_usage])
+        self._active = np.concatenate([self._active, np.zeros(n_new, dtype=bool)])
+        np.maximum.at(self._max_pallet_usage, product, pallet_usage)
+        np.maximum.at(self._max_lot_usage, product, lot_usage)
+
+    def _update_big_m(self):
+        # the relaxing constants are the smallest ones that leave the same transfers feasible as BIG_M does: zero
+        # pallets or lots fit any option and a product off closed pallets can still cover the mandatory closed
+        # pallets on its own. BIG_M itself makes HiGHS report feasible models as infeasible
+        lpp = self._product_lots_per_pallet
+        pallets_big_m = self._max_pallet_usage + lpp * np.ceil(max(0, self.mandatory_closed_transport_units)) + 1
+        lots_big_m = self._max_lot_usage + 1
+        # the constants only grow, a model that is solved again keeps them
+        changed = np.flatnonzero((pallets_big_m > self._pallets_big_m) | (lots_big_m > self._lots_big_m))
+        self._pallets_big_m[changed] = np.maximum(self._pallets_big_m[changed], pallets_big_m[changed])
+        self._lots_big_m[changed] = np.maximum(self._lots_big_m[changed], lots_big_m[changed])
+        infinity = self._highspy.kHighsInf
+        for k in changed:
+            y, (_, _, pallets_above, pallets_below, lots_above, lots_below) = self._product_columns[k, 0], \
+                self._product_rows[k]
+            pallets_m, lots_m = self._pallets_big_m[k], self._lots_big_m[k]
+            # closed pallets above and below, relaxed when the product is not sent in closed pallets
+            self.highs.changeCoeff(pallets_above, y, pallets_m)
+            self.highs.changeRowBounds(pallets_above, -infinity, pallets_m)
+            self.highs.changeCoeff(pallets_below, y, -pallets_m)
+            self.highs.changeRowBounds(pallets_below, -pallets_m, infinity)
+            # lots above and below, relaxed when the product is sent in closed pallets
+            self.highs.changeCoeff(lots_above, y, -lots_m)
+            self.highs.changeRowBounds(lots_above, -infinity, 0)
+            self.highs.changeCoeff(lots_below, y, lots_m)
+            self.highs.changeRowBounds(lots_below, 0, infinity)
+
+    def _add_columns(self, cost, upper, rows, columns, values) -> np.ndarray:
+        # integer columns with the entries of the existing rows, columns counted from the first new one
+        n_columns, first_column = len(cost), self.highs.getNumCol()
+        matrix = scipy.sparse.csc_matrix((values, (rows, columns)), shape=(self.highs.getNumRow(), n_columns))
+        upper = np.where(np.isinf(upper), self._highspy.kHighsInf, upper)
+        self.highs.addCols(n_columns, np.asarray(cost, dtype=float), np.zeros(n_columns), upper, matrix.nnz,
+                           matrix.indptr[:-1].astype(np.int32), matrix.indices.astype(np.int32), matrix.data)
+        indices = first_column + np.arange(n_columns)
+        self.highs.changeColsIntegrality(n_columns, indices.astype(np.int32),
+                                         np.full(n_columns, self._highspy.HighsVarType.kInteger))
+        return indices
+
+    def _add_rows(self, n_rows, rows, columns, values) -> int:
+        # free rows with the entries of the existing columns, their bounds are set by update, rows counted from the
+        # first new one
+        first_row = self.highs.getNumRow()
+        matrix = scipy.sparse.csr_matrix((values, (rows, columns)), shape=(n_rows, self.highs.getNumCol()))
+        infinity = self._highspy.kHighsInf
+        self.highs.addRows(n_rows, np.full(n_rows, -infinity), np.full(n_rows, infinity), matrix.nnz,
+                           matrix.indptr[:-1].astype(np.int32), matrix.indices.astype(np.int32), matrix.data)
+        return first_row
+
+    def _change_cols_bounds(self, columns, lower, upper):
+        self.highs.changeColsBounds(len(columns), np.asarray(columns, dtype=np.int32), lower, upper)
+
+    def _change_rows_bounds(self, rows, lower, upper):
+        self.highs.changeRowsBounds(len(rows), np.asarray(rows, dtype=np.int32), lower, upper)
+
+    def solve(self, start: Dict[str, float] = None) -> Dict[str, float]:
+        """
+        Quantity chosen for every product, raises ValueError when the model has no optimal solution. The options of
+        start, recommendations of an earlier solve, are handed to HiGHS as a MIP start, which completes them when they
+        are still feasible
+        """
+        if start:
+            self._set_start(start)
+        self.highs.run()
+        if self.highs.getModelStatus() != self._highspy.HighsModelStatus.kOptimal:
+            raise ValueError("The model could not be solved")
+        solution = np.array(self.highs.getSolution().col_value)
+        if solution[self._product_columns[:, 3]].sum() > 0.5:
+            logger.warning("Some mandatory products could not be transshipped")
+        chosen = np.flatnonzero(self._active & (solution[self._option_column] > 0.5))
+        return {self._product_sku[self._option_product[k]]: self._option_quantity[k].item() for k in chosen}
+
+    def _set_start(self, start: Dict[str, float]):
+        active_products = np.unique(self._option_product[self._active])
+        product_of_sku = {self._product_sku[k]: k for k in active_products}
+        chosen = [self._options.get((product_of_sku.get(sku), quantity)) for sku, quantity in start.items()]
+        chosen = np.array([k for k in chosen if k is not None and self._active[k]], dtype=int)
+        if len(chosen) == 0 or len(chosen) < len(active_products):
+            # HiGHS would have to solve a sub-MIP to complete the start, often slower than no start at all
+            return
+        # every product off closed pallets with its pallets as lots, the first one covering the mandatory closed pallets
+        value = np.zeros(self.highs.getNumCol())
+        value[self._option_column[chosen]] = 1
+        product = self._option_product[chosen]
+        value[self._product_columns[product, 2]] = self._option_pallet_usage[chosen]
+        value[self._product_columns[active_products[0], 1]] = np.ceil(max(0, self.mandatory_closed_transport_units))
+        value[self._product_columns[product, 3]] = self._mandatory[product] & (self._option_lot_usage[chosen] < 1)
+        solution = self._highspy.HighsSolution()
+        solution.col_value = value
+        self.highs.setSolution(solution)
+
+    @property
+    def objective_value(self) -> float:
+        return self.highs.getInfo().objective_function_value
+
+
+class KnapsackTransferModel:
+    """
+    The transfer model when there are neither mandatory products nor mandatory closed pallets, which leaves a
+    multiple-choice knapsack: one option per product under the capacity in pallets. Feasible options use whole
+    pallets, so a dynamic program over the pallets of capacity is exact. Above max_dp_cells it is replaced by the
+    greedy solution of the LP relaxation, whose cost exceeds the optimum by at most the gap to the LP bound.
+    """
+
+    def __init__(self, options: TransferOptions, capacity_in_transport_units: float,
+                 max_dp_cells: int = MAX_DP_CELLS):
+        self.options = options.subset(options.feasible)
+        self.capacity = int(np.floor(capacity_in_transport_units + 1e-9))
+        self.max_dp_cells = max_dp_cells
+        self.objective_value = None
+        self.gap = None
+
+    @staticmethod
+    def is_eligible(options: TransferOptions, mandatory_closed_transport_units: float) -> bool:
+        return mandatory_closed_transport_units <= 0 and not options.mandatory.any()
+
+    def solve(self) -> Dict[str, float]:
+        """
+        Quantity chosen for every product, raises ValueError when the model has no solution
+        """
+        options = self.options
+        n_products = len(options.skus)
+        usage = np.round(options.pallet_usage).astype(int)
+        if not np.isin(np.arange(n_products), options.product).all() or self.capacity < 0:
+            raise ValueError("The model could not be solved")
+        if n_products * (self.capacity + 1) <= self.max_dp_cells:
+            chosen = self._dynamic_program(usage)
+            self.gap = 0.
+        else:
+            chosen = self._greedy(usage)
+        self.objective_value = options.cost[chosen].sum().item()
+        return {options.skus[options.product[k]]: options.quantity[k].item() for k in chosen}
+
+    def _dynamic_program(self, usage: np.ndarray) -> np.ndarray:
+        options = self.options
+        n_products, capacity = len(options.skus), self.capacity
+        # cheapest cost of the products seen so far within each number of pallets, and the option that attains it
+        cheapest = np.zeros(capacity + 1)
+        choice = np.full((n_products, capacity + 1), -1, dtype=np.int32)
+        for product in range(n_products):
+            best = np.full(capacity + 1, np.inf)
+            for k in np.flatnonzero(options.product == product):
+                if usage[k] > capacity:
+                    continue
+                cost = np.full(capacity + 1, np.inf)
+                cost[usage[k]:] = cheapest[:capacity + 1 - usage[k]] + options.cost[k]
+                better = cost < best
+                best[better] = cost[better]
+                choice[product, better] = k
+            cheapest = best
+        if not np.isfinite(cheapest[capacity]):
+            raise ValueError("The model could not be solved")
+        chosen, pallets = [], capacity
+        for product in reversed(range(n_products)):
+            chosen.append(choice[product, pallets])
+            pallets -= usage[chosen[-1]]
+        return np.array(chosen[::-1])
+
+    def _greedy(self, usage: np.ndarray) -> np.ndarray:
+        options = self.options
+        n_products = len(options.skus)
+        # start from the cheapest of the smallest options of every product and move along the lower convex hull of
+        # its (pallets, cost) options, taking the steps that save the most per pallet while they fit
+        chosen = np.zeros(n_products, dtype=int)
+        steps = []
+        for product in range(n_products):
+            candidates = np.flatnonzero(options.product == product)
+            candidates = candidates[np.lexsort((options.cost[candidates], usage[candidates]))]
+            hull = [candidates[0]]
+            for k in candidates[1:]:
+                if options.cost[k] >= options.cost[hull[-1]] or usage[k] == usage[hull[-1]]:
+                    continue
+                while len(hull) > 1 and self._slope(hull[-2], hull[-1], usage) >= self._slope(hull[-2], k, usage):
+                    hull.pop()
+                hull.append(k)
+            chosen[product] = hull[0]
+            steps += [(self._slope(i, k, usage), product, k) for i, k in zip(hull[:-1], hull[1:])]
+        remaining = self.capacity - usage[chosen].sum()
+        if remaining < 0:
+            raise ValueError("The model could not be solved")
+        bound = options.cost[chosen].sum()
+        blocked, split = set(), False
+        for slope, product, k in sorted(steps):
+            step = usage[k] - usage[chosen[product]]
+            if not split:
+                # the LP relaxation takes the steps in the same order, the first one that does not fit in part
+                bound += slope * min(step, max(remaining, 0))
+                split = step > remaining
+            if product in blocked:
+                continue
+            if step <= remaining:
+                remaining -= step
+                chosen[product] = k
+            else:
+                blocked.add(product)
+        self.gap = options.cost[chosen].sum() - bound
+        logger.info(f"The greedy transfer selection is within {self.gap:.4f} of the LP bound {bound:.4f}")
+        return chosen
+
+    def _slope(self, i: int, k: int, usage: np.ndarray) -> float:
+        return (self.options.cost[k] - self.options.cost[i]) / (usage[k] - usage[i])
+
+
+class OptimizationBackends(Enum):
+    PULP = ('PULP', 'PuLP model solved by the HiGHS binary')
+    HIGHS = ('HIGHS', 'Sparse model solved in process through highspy')
+
+    def __init__(self, code, description):
+        self._code = code
+        self._description = description
+
+    @property
+    def code(self):
+        return self._code
+
+    @property
+    def description(self):
+        return self._description
+
+    @staticmethod
+    def get_backend_by_code(code):
+        for backend in OptimizationBackends:
+            if backend.code == code:
+                return backend
+        raise ValueError(f"Optimization backend {code} is not supported")
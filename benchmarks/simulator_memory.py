@@ -0,0 +1,82 @@
+"""
+Peak resident memory of NonPerishableInventorySimulator.simulate on a long-horizon SKU, with and without the
+low-memory accumulators. Every configuration runs in its own process so that peak RSS figures do not leak into each
+other.
+
+    python -m benchmarks.simulator_memory
+"""
+import multiprocessing
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.src.classes import Product, Supplier
+from app.src.simulator import SimulationsFactory, SimulationSettings
+
+HORIZON_DAYS = 120
+SAMPLE_SIZE = 200000
+
+
+def long_horizon_product() -> Product:
+    supplier = Supplier(
+        external_id="123",
+        lead_time_model={
+            'distribution': 'WEIGHTED_DISCRETE',
+            'prob_value_pairs': {60: 0.1, 70: 0.2, 80: 0.3, 90: 0.4}
+        }
+    )
+    start_date = datetime(2024, 9, 26)
+    return Product(
+        sku="123",
+        warehouse="VLP",
+        desired_service_level=0.9,
+        days_to_next_review=7,
+        units_per_product_dim=50,
+        supplier_dim_to_product_dim_conversion_factor=20,
+        current_inventory=9000,
+        detailed_incoming_inventory={},
+        forecast={datetime.strftime(start_date + timedelta(days=i), "%Y-%m-%d"): 100.0 for i in range(HORIZON_DAYS)},
+        forecast_error_model={'distribution': 'NORM', 'mu': 0.0, 'sigma': 35},
+        current_price_per_unit=10,
+        percentage_cost_per_unit_excess=100,
+        percentage_cost_per_unit_shortage=15,
+        mandatory=False,
+        lots_expiration_by_date={},
+        suppliers=[supplier]
+    )
+
+
+def _run(settings: SimulationSettings, queue):
+    np.random.seed(0)
+    simulator = SimulationsFactory.get_simulator(long_horizon_product(), True, settings)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    # the halfwidth check is satisfied at this sample size, so no rescaling happens
+    simulator.simulate(sample_size=SAMPLE_SIZE)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in kilobytes on linux and in bytes on macos
+    scale = 1024 if sys.platform != 'darwin' else 1024 ** 2
+    queue.put((baseline_rss / scale, peak_rss / scale, elapsed, len(simulator.stockout_units_by_quantity)))
+
+
+if __name__ == '__main__':
+    context = multiprocessing.get_context('spawn')
+    configurations = {
+        'per quantity, matrices': SimulationSettings(batched=False),
+        'per quantity, low memory': SimulationSettings(batched=False, low_memory=True),
+        'batched, tensors': SimulationSettings(),
+        'batched, low memory': SimulationSettings(low_memory=True),
+    }
+    print(f"{HORIZON_DAYS} forecast days, {SAMPLE_SIZE} samples")
+    for name, settings in configurations.items():
+        queue = context.Queue()
+        process = context.Process(target=_run, args=(settings, queue))
+        process.start()
+        baseline, peak, elapsed, quantities = queue.get()
+        process.join()
+        print(f"{name:<26} peak RSS {peak:8.1f} MB (+{peak - baseline:7.1f} MB during simulate)"
+              f" {elapsed:6.2f} s, {quantities} quantities")
@@ -0,0 +1,71 @@
+import logging
+
+import numpy as np
+
+from app.src.classes import Product, Supplier, TranshipmentProblem
+from app.src.loggin import logger
+
+logger.setLevel(logging.ERROR)
+
+DATES = [f'2024-09-{day}' for day in range(26, 31)] + [f'2024-10-0{day}' for day in range(1, 10)] + ['2024-10-10']
+
+
+def make_product(sku: str, current_inventory: int, warehouse: str = 'VLP', error_distribution: str = 'NORM',
+                 incoming: dict = None, lot_size: int = 50, lots_per_pallet: int = 20, mandatory: bool = False,
+                 mean_demand: float = 100) -> Product:
+    supplier = Supplier(external_id='1', lead_time_model={'distribution': 'WEIGHTED_DISCRETE',
+                                                          'prob_value_pairs': {0: 0.1, 1: 0.2, 2: 0.3, 3: 0.4}})
+    if error_distribution == 'NORM':
+        forecast_error_model = {'distribution': 'NORM', 'mu': 0.0, 'sigma': 35}
+    else:
+        forecast_error_model = {'distribution': 'DISC', 'values': [-20, -5, 0, 3, 10, 15, 22, 30, -8]}
+    rng = np.random.default_rng(sum(map(ord, sku)))
+    # no demand on one day a week, as on the days the warehouses close
+    forecast = {fecha: 0. if k % 7 == 3 else float(round(mean_demand * (0.8 + 0.4 * rng.random())))
+                for k, fecha in enumerate(DATES)}
+    return Product(sku=sku, warehouse=warehouse, desired_service_level=0.9, days_to_next_review=7,
+                   units_per_product_dim=lot_size, supplier_dim_to_product_dim_conversion_factor=lots_per_pallet,
+                   current_inventory=current_inventory, detailed_incoming_inventory=incoming or {},
+                   forecast=forecast, forecast_error_model=forecast_error_model, current_price_per_unit=10,
+                   percentage_cost_per_unit_excess=100, percentage_cost_per_unit_shortage=15,
+                   lots_expiration_by_date={}, mandatory=mandatory, suppliers=[supplier])
+
+
+def make_problem(capacity: float, mandatory_closed: float = 0) -> TranshipmentProblem:
+    return TranshipmentProblem(execution_id='e1', origin_warehouse='VLP', destination_warehouse='SPN',
+                               capacity_in_transport_units=capacity, mandatory_closed_transport_units=mandatory_closed,
+                               execution_date='2024-09-26', transhipment_lead_time_probability={},
+                               origin_products={}, destination_products={})
+
+
+def synthetic_curves(n_products: int, capacity: float, mandatory_closed: float = 0, seed: int = 0,
+                     mandatory_share: float = 0.2):
+    """
+    Problem and curves of n_products with random costs, lot sizes and pallets, to exercise the transfer models without
+    simulating. The origin costs are not monotone in the quantity, so some options are dominated and some are not
+    """
+    rng = np.random.default_rng(seed)
+    problem = make_problem(capacity, mandatory_closed)
+    model_products = {'origin': {}, 'destination': {}}
+    for k in range(n_products):
+        sku = f'P{k}'
+        lot_size, lots_per_pallet = int(rng.choice([10, 25, 50])), int(rng.choice([4, 10, 20]))
+        origin_product = make_product(sku, 1000, lot_size=lot_size, lots_per_pallet=lots_per_pallet,
+                                      mandatory=bool(rng.random() < mandatory_share))
+        origin_product.percentage_cost_per_unit_shortage = float(rng.uniform(5, 30))
+        origin_product.current_price_per_unit = float(rng.uniform(1, 20))
+        problem.add_origin_product(origin_product)
+        problem.add_destination_product(make_product(sku, 10, warehouse='SPN', lot_size=lot_size,
+                                                     lots_per_pallet=lots_per_pallet))
+        n_quantities = int(rng.integers(1, 40))
+        quantities = [j * lot_size for j in range(n_quantities)]
+        base = rng.uniform(0, 50)
+        model_products['origin'][sku] = {
+            'lost_sales': {q: float(max(0., base + rng.normal(0, 10) - 0.3 * j * rng.uniform(-1, 2)))
+                           for j, q in enumerate(quantities)},
+            'waste': {q: float(rng.uniform(0, 2)) for q in quantities}}
+        destination_quantities = quantities + [quantities[-1] + lot_size] if rng.random() < 0.5 \
+            else quantities[:max(1, n_quantities - 3)]
+        model_products['destination'][sku] = {'lost_sales': {q: 1. for q in destination_quantities},
+                                              'waste': {q: 0. for q in destination_quantities}}
+    return problem, model_products
@@ -0,0 +1,215 @@
+import base64
+import itertools
+import json
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+from app.src.api_clients import MLOpsClient, InTransitStockService, InTransitStockPRApiClient, \
+    AvailableStockPRApiClient, TokenProvider
+
+
+class _PagesHandler(BaseHTTPRequestHandler):
+    """
+    Serves the pages of the MLOps query endpoint from the pages of its server, pages past the last one are empty. The
+    earlier pages are the slowest, so the pages of a window complete out of order. The first empty page answers at once
+    and the ones past it late, so that the pages requested past the first empty one are only those of its window
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        page = body['page']
+        self.server.requested_pages.append(page)
+        first_empty_page = next(k for k in itertools.count(1) if k not in self.server.pages)
+        if page < first_empty_page:
+            time.sleep(0.02 * (4 - page % 4))
+        elif page > first_empty_page:
+            time.sleep(0.2)
+        if page in self.server.failing_pages:
+            self.send_response(400)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        rows = self.server.pages.get(page, [])
+        out = json.dumps({'result': rows}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestMLOpsPaging(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _PagesHandler)
+        self.server.pages = {}
+        self.server.failing_pages = set()
+        self.server.requested_pages = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def set_rows(self, n_rows: int, limit: int):
+        self.server.pages = {page + 1: [{'sku_code': f'S{k}', 'forecast_error_model': {'params': [k]}}
+                                        for k in range(page * limit, min((page + 1) * limit, n_rows))]
+                             for page in range((n_rows + limit - 1) // limit)}
+
+    def test_pages_are_returned_in_order(self):
+        self.set_rows(23 * 10 + 7, 10)
+        for max_concurrent_pages in (1, 4, 8):
+            with self.subTest(max_concurrent_pages=max_concurrent_pages):
+                client = MLOpsClient(self.url, 'key', max_concurrent_pages=max_concurrent_pages)
+                errors = client.get_forecast_errors('W', limit=10)
+                self.assertEqual(list(errors), [f'S{k}' for k in range(23 * 10 + 7)])
+                self.assertEqual(errors['S17'], [17])
+
+    def test_paging_stops_at_the_first_empty_page(self):
+        self.set_rows(50, 10)
+        # a page past the first empty one that is not empty must not be returned
+        self.server.pages[7] = [{'sku_code': 'LATE', 'forecast_error_model': {'params': [0]}}]
+        for max_concurrent_pages in (1, 4):
+            with self.subTest(max_concurrent_pages=max_concurrent_pages):
+                self.server.requested_pages.clear()
+                errors = MLOpsClient(self.url, 'key', max_concurrent_pages=max_concurrent_pages).get_forecast_errors(
+                    'W', limit=10)
+                self.assertEqual(list(errors), [f'S{k}' for k in range(50)])
+                # at most a window of pages past the first empty one is requested
+                self.assertLess(max(self.server.requested_pages), 6 + max_concurrent_pages)
+
+    def test_a_failing_page_raises(self):
+        self.set_rows(50, 10)
+        self.server.failing_pages = {3}
+        for max_concurrent_pages in (1, 4):
+            with self.subTest(max_concurrent_pages=max_concurrent_pages):
+                client = MLOpsClient(self.url, 'key', max_concurrent_pages=max_concurrent_pages)
+                with self.assertRaises(requests.HTTPError):
+                    client.get_forecast_errors('W', limit=10)
+
+
+class _InTransitStockClient:
+    """
+    In transit records of several purchase orders, some of the same sku and day, the records past the range of a
+    request are left for the service to drop
+    """
+    records = [{'sku': 'A', 'quantity': 10, 'arrivalDate': '2024-10-01T08:00:00'},
+               {'sku': 'A', 'quantity': 5, 'arrivalDate': '2024-10-01T17:30:00'},
+               {'sku': 'A', 'quantity': 7, 'arrivalDate': '2024-10-03T00:00:00'},
+               {'sku': 'B', 'quantity': 3, 'arrivalDate': '2024-10-02'},
+               {'sku': 'B', 'quantity': 4, 'arrivalDate': '2024-10-02'},
+               {'sku': 'B', 'quantity': 100, 'arrivalDate': '2024-10-05'}]
+
+    def __init__(self):
+        self.requests = 0
+
+    def get_in_transit_stock(self, skus, warehouse, initial_date, final_date, excluded_types=None):
+        self.requests += 1
+        return [record for record in self.records if record['sku'] in skus]
+
+    def get_in_transit_stock_by_day(self, skus, warehouse, days, excluded_types=None, max_workers=8):
+        self.requests += len(days)
+        return {day: [record for record in self.records if record['sku'] in skus
+                      and record['arrivalDate'][:10] == day] for day in days}
+
+
+class TestInTransitStockService(unittest.TestCase):
+    expected = {'A': {'2024-10-01': 15, '2024-10-03': 7}, 'B': {'2024-10-02': 7}}
+
+    def test_per_day_requests_sum_the_records_of_a_day(self):
+        client = _InTransitStockClient()
+        in_transit = InTransitStockService(client).get_detailed_in_transit_stock(['A', 'B'], 'VLP', '2024-10-01',
+                                                                                  '2024-10-04')
+        self.assertEqual(in_transit, self.expected)
+        self.assertEqual(client.requests, 4)
+
+    def test_date_field_buckets_a_single_request(self):
+        client = _InTransitStockClient()
+        service = InTransitStockService(client, date_field='arrivalDate')
+        self.assertEqual(service.get_detailed_in_transit_stock(['A', 'B'], 'VLP', '2024-10-01', '2024-10-04'),
+                         self.expected)
+        self.assertEqual(client.requests, 1)
+
+
+class _TokenHandler(BaseHTTPRequestHandler):
+    """
+    Issues a new JWT on every request to the auth endpoint and serves a stock record to the requests that carry a
+    token of its server that has not been revoked, 401 to the others
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        status = 200
+        if self.path.endswith('/auth/token'):
+            self.server.issued.append(self._jwt(len(self.server.issued)))
+            out = {'token': self.server.issued[-1]}
+        elif self.headers.get('Authorization', '')[len('Bearer '):] in self.server.valid_tokens():
+            self.server.served += 1
+            out = [{'sku': 'S', 'quantity': 1, 'whProductId': 1, 'warehouse': 'W', 'source': 'a',
+                    'theoreticalInventory': 2}]
+        else:
+            self.server.rejected += 1
+            status, out = 401, {}
+        out = json.dumps(out).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    @staticmethod
+    def _jwt(n: int) -> str:
+        def encode(part: dict) -> str:
+            return base64.urlsafe_b64encode(json.dumps(part).encode()).rstrip(b'=').decode()
+        return f"{encode({'alg': 'none'})}.{encode({'n': n, 'exp': time.time() + 3600})}.signature"
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTokenProvider(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _TokenHandler)
+        self.server.issued, self.server.revoked = [], set()
+        self.server.served, self.server.rejected = 0, 0
+        self.server.valid_tokens = lambda: set(self.server.issued) - self.server.revoked
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_clients_share_a_single_authentication(self):
+        in_transit = InTransitStockPRApiClient(self.url, self.url, 'user', 'password')
+        available = AvailableStockPRApiClient(self.url, self.url, 'user', 'password')
+        self.assertIs(in_transit._token_provider, available._token_provider)
+        self.assertIsNot(TokenProvider.for_auth_url(self.url, 'user', 'other'), in_transit._token_provider)
+        InTransitStockService(in_transit).get_detailed_in_transit_stock(['S'], 'W', '2024-10-01', '2024-10-10')
+        available.get_available_stock([1])
+        self.assertEqual((len(self.server.issued), self.server.served), (1, 11))
+
+    def test_a_rejected_token_is_replaced_once(self):
+        available = AvailableStockPRApiClient(self.url, self.url, 'user', 'password')
+        self.assertEqual(len(available.get_available_stock([1])), 1)
+        self.server.revoked.update(self.server.issued)
+        self.assertEqual(len(available.get_available_stock([1])), 1)
+        self.assertEqual((len(self.server.issued), self.server.rejected), (2, 1))
+        # a token rejected again after the retry fails the request
+        self.server.valid_tokens = lambda: set()
+        with self.assertRaises(requests.HTTPError):
+            available.get_available_stock([1])
+        self.assertEqual((len(self.server.issued), self.server.rejected), (3, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
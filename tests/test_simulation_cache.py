@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app.src import simulation_cache
+from app.src.simulation_cache import SimulationCache
+from app.src.simulator import SimulationSettings
+from app.src.solver import Solver
+from tests.factories import make_product, make_problem
+
+
+def problem_of(execution_id: str):
+    problem = make_problem(10)
+    problem.execution_id = execution_id
+    for k in range(2):
+        problem.add_origin_product(make_product(f'S{k}', 1500 + 500 * k, incoming={'2024-10-01': 100}))
+        problem.add_destination_product(make_product(f'S{k}', 50 * k, warehouse='SPN'))
+    return problem
+
+
+def curves_of(n: int) -> dict:
+    return {'lost_sales': {q: float(q) for q in range(0, 50 * n, 50)}, 'waste': {q: 0. for q in range(0, 50 * n, 50)}}
+
+
+class TestSimulationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_counts_hits_and_misses(self):
+        cache = SimulationCache(self.directory.name)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', curves_of(3))
+        self.assertEqual(cache.get('a'), curves_of(3))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        # the entries of an earlier run are found by a new cache on the same directory
+        self.assertEqual(SimulationCache(self.directory.name).get('a'), curves_of(3))
+
+    def test_evicts_the_least_recently_used(self):
+        cache = SimulationCache(self.directory.name)
+        cache.put('a', curves_of(10))
+        entry_size = cache.stats['size_bytes']
+        cache.max_size_bytes = 2 * entry_size
+        cache.put('b', curves_of(10))
+        cache.get('a')
+        cache.put('c', curves_of(10))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['a.json', 'c.json'])
+        self.assertLessEqual(cache.stats['size_bytes'], 2 * entry_size)
+
+    def test_rerun_hits_the_curves_of_the_first_run(self):
+        settings = SimulationSettings()
+        first = Solver(problem_of('e1'), settings, SimulationCache(self.directory.name))
+        first.get_products_params()
+        self.assertEqual(first.simulation_cache.hits, 0)
+        # a rerun of the same inputs under another execution keys the products the same
+        rerun = Solver(problem_of('e2'), settings, SimulationCache(self.directory.name))
+        rerun.get_products_params()
+        self.assertEqual(rerun.simulation_cache.stats['hits'], 4)
+        self.assertEqual(rerun.simulation_cache.stats['misses'], 0)
+        self.assertEqual(rerun.model_products, first.model_products)
+
+    def test_key_changes_with_the_version_and_not_with_neutral_settings(self):
+        product = make_product('S0', 1500)
+        key = SimulationCache.key(product, True, SimulationSettings(), 500, 3)
+        self.assertEqual(SimulationCache.key(product, True, SimulationSettings(low_memory=True,
+                                                                               analytic_cross_check=True), 500, 3),
+                         key)
+        self.assertNotEqual(SimulationCache.key(product, True, SimulationSettings(sampling='LHS'), 500, 3), key)
+        with mock.patch.object(simulation_cache, 'SIMULATION_CACHE_VERSION',
+                               simulation_cache.SIMULATION_CACHE_VERSION + 1):
+            self.assertNotEqual(SimulationCache.key(product, True, SimulationSettings(), 500, 3), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
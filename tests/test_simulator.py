@@ -0,0 +1,97 @@
+import unittest
+
+import numpy as np
+
+from app.src.simulator import SimulationsFactory, SimulationSettings, WarehouseInventorySimulator
+from app.src.solver import Solver
+from tests.factories import make_product, make_problem
+
+SAMPLE_SIZE = 500
+
+# (current inventory, is origin, forecast error distribution, max value to transfer)
+CASES = [(4500, True, 'NORM', None), (800, True, 'DISC', None), (0, False, 'NORM', None), (200, False, 'DISC', 100),
+         (4500, True, 'NORM', 1000), (30, True, 'NORM', None), (4500, True, 'NORM', 0)]
+
+
+def simulate(product, is_origin: bool, max_value_to_transfer: int = None, **settings) -> dict:
+    np.random.seed(3)
+    simulator = SimulationsFactory.get_simulator(product, is_origin, SimulationSettings(**settings))
+    simulator.simulate(max_value_to_transfer=max_value_to_transfer, sample_size=SAMPLE_SIZE)
+    return simulator.stockout_units_by_quantity
+
+
+class TestSimulationEngines(unittest.TestCase):
+    """
+    The engines only change how the curves are computed, on the same scenarios they give the same curves
+    """
+
+    def test_batched_matches_per_quantity(self):
+        for inventory, is_origin, distribution, max_value in CASES:
+            with self.subTest(inventory=inventory, is_origin=is_origin, distribution=distribution, max_value=max_value):
+                product = make_product('X', inventory, error_distribution=distribution, incoming={'2024-10-01': 300})
+                expected = simulate(product, is_origin, max_value, batched=False)
+                self.assertEqual(simulate(product, is_origin, max_value), expected)
+                self.assertEqual(simulate(product, is_origin, max_value, max_batch_elements=5000), expected)
+                self.assertEqual(simulate(product, is_origin, max_value, batched=False, low_memory=True), expected)
+                self.assertEqual(simulate(product, is_origin, max_value, low_memory=True), expected)
+
+    def test_bisection_matches_linear_scan(self):
+        for inventory, is_origin, distribution, max_value in CASES:
+            with self.subTest(inventory=inventory, is_origin=is_origin, distribution=distribution, max_value=max_value):
+                product = make_product('X', inventory, error_distribution=distribution, incoming={'2024-10-01': 300})
+                expected = simulate(product, is_origin, max_value)
+                self.assertEqual(simulate(product, is_origin, max_value, bisection_search=True), expected)
+                self.assertEqual(simulate(product, is_origin, max_value, bisection_search=True, low_memory=True),
+                                 expected)
+
+    def test_warehouse_engine_matches_per_product(self):
+        max_values_to_transfer = {'S5': 300, 'S7': 0}
+        for is_origin in (True, False):
+            products = [make_product(f'S{k}', 1500 + 300 * k if is_origin else 100 * k,
+                                     warehouse='VLP' if is_origin else 'SPN',
+                                     error_distribution='DISC' if k % 3 == 2 else 'NORM',
+                                     incoming={'2024-10-01': 100} if is_origin else None) for k in range(12)]
+            products[3].forecast_error_model = {'distribution': 'FOO'}
+            # the engines draw the scenarios of the products in the same order from the global random state
+            np.random.seed(3)
+            expected = {}
+            for product in products:
+                try:
+                    simulator = SimulationsFactory.get_simulator(product, is_origin, SimulationSettings())
+                    simulator.simulate(max_value_to_transfer=max_values_to_transfer.get(product.sku),
+                                       sample_size=SAMPLE_SIZE)
+                    expected[product.sku] = simulator.stockout_units_by_quantity
+                except ValueError:
+                    pass
+            for max_batch_elements in (2 ** 22, 20000):
+                with self.subTest(is_origin=is_origin, max_batch_elements=max_batch_elements):
+                    np.random.seed(3)
+                    simulator = WarehouseInventorySimulator(products, is_origin,
+                                                            SimulationSettings(max_batch_elements=max_batch_elements),
+                                                            max_values_to_transfer=max_values_to_transfer)
+                    simulator.simulate(sample_size=SAMPLE_SIZE)
+                    self.assertEqual(set(simulator.skipped), {'S3'})
+                    self.assertEqual({sku: curves['lost_sales'] for sku, curves in simulator.curves.items()},
+                                     expected)
+
+
+class TestParallelSimulations(unittest.TestCase):
+
+    def test_process_pool_matches_serial(self):
+        problem = make_problem(10)
+        for k in range(6):
+            problem.add_origin_product(make_product(f'S{k}', 1000 + 400 * k, incoming={'2024-10-01': 100},
+                                                    error_distribution='DISC' if k % 2 else 'NORM'))
+            problem.add_destination_product(make_product(f'S{k}', 60 * k, warehouse='SPN'))
+        problem.origin_products['S4'].forecast_error_model = {'distribution': 'FOO'}
+        serial = Solver(problem, SimulationSettings())
+        serial.get_products_params()
+        parallel = Solver(problem, SimulationSettings(max_workers=3))
+        parallel.get_products_params()
+        self.assertNotIn('S4', serial.model_products['origin'])
+        self.assertNotIn('S4', serial.model_products['destination'])
+        self.assertEqual(parallel.model_products, serial.model_products)
+
+
+if __name__ == '__main__':
+    unittest.main()
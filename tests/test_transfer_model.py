@@ -0,0 +1,148 @@
+import copy
+import subprocess
+import unittest
+
+import numpy as np
+from highsbox import highs_bin_path
+
+from app.src.solver import Solver, SolverSession
+from app.src.transfer_model import TransferOptions, HighsTransferModel, KnapsackTransferModel
+from tests.factories import synthetic_curves
+
+# (products, capacity in transport units, mandatory closed transport units)
+PROBLEMS = [(10, 5, 0), (10, 2, 1), (30, 8, 2), (30, 1, 0), (60, 15, 3)]
+
+
+def highs_binary_runs() -> bool:
+    # the binary of highsbox needs the HiGHS shared library on the library path
+    try:
+        return subprocess.run([highs_bin_path(), '--version'], capture_output=True).returncode == 0
+    except OSError:
+        return False
+
+
+def options_of(problem, model_products) -> TransferOptions:
+    products = sorted(set(model_products['origin']) & set(model_products['destination']))
+    return TransferOptions.from_curves(model_products, products, problem)
+
+
+def highs_objective(options: TransferOptions, problem) -> float:
+    model = HighsTransferModel(options, problem.capacity_in_transport_units, problem.mandatory_closed_transport_units)
+    model.solve()
+    return model.objective_value
+
+
+def recommendations_cost(recommendations: dict, options: TransferOptions, problem):
+    """
+    Cost of the chosen options and number of mandatory products left behind
+    """
+    chosen = [np.flatnonzero((options.product == options.skus.index(sku)) & (options.quantity == quantity))[0]
+              for sku, quantity in recommendations.items()]
+    left_behind = sum(1 for sku, quantity in recommendations.items()
+                      if problem.origin_products[sku].mandatory and quantity == 0)
+    return options.cost[chosen].sum(), left_behind
+
+
+class TestOptimizationBackends(unittest.TestCase):
+    """
+    The backends solve the same transfer MILP, the pruning, the knapsack and the replanning session are shortcuts to
+    its optimum, they must reach the same objective value
+    """
+
+    @unittest.skipUnless(highs_binary_runs(), 'the HiGHS binary of highsbox does not run here')
+    def test_highs_matches_pulp(self):
+        for seed, (n_products, capacity, mandatory_closed) in enumerate(PROBLEMS):
+            with self.subTest(n_products=n_products, capacity=capacity, mandatory_closed=mandatory_closed):
+                problem, model_products = synthetic_curves(n_products, capacity, mandatory_closed, seed,
+                                                           mandatory_share=0.3)
+                options = options_of(problem, model_products)
+                costs = []
+                for backend in ('HIGHS', 'PULP'):
+                    solver = Solver(problem, backend=backend)
+                    solver.model_products = model_products
+                    solver.valid_products = set(options.skus)
+                    self.assertEqual(set(solver.recommendations), set(options.skus))
+                    costs.append(recommendations_cost(solver.recommendations, options, problem))
+                self.assertEqual(costs[0][1], costs[1][1])
+                self.assertAlmostEqual(costs[0][0], costs[1][0], places=4)
+
+    def test_pruning_keeps_the_optimum(self):
+        for seed, (n_products, capacity, mandatory_closed) in enumerate(PROBLEMS):
+            with self.subTest(n_products=n_products, capacity=capacity, mandatory_closed=mandatory_closed):
+                problem, model_products = synthetic_curves(n_products, capacity, mandatory_closed, seed)
+                options = options_of(problem, model_products)
+                pruned = options.prune_dominated()
+                self.assertLess(len(pruned), len(options))
+                self.assertAlmostEqual(highs_objective(pruned, problem), highs_objective(options, problem), places=4)
+
+    def test_knapsack_matches_highs(self):
+        for seed, (n_products, capacity, _) in enumerate(PROBLEMS):
+            with self.subTest(n_products=n_products, capacity=capacity):
+                problem, model_products = synthetic_curves(n_products, capacity, 0, seed, mandatory_share=0)
+                options = options_of(problem, model_products).prune_dominated()
+                self.assertTrue(KnapsackTransferModel.is_eligible(options, 0))
+                knapsack = KnapsackTransferModel(options, capacity)
+                knapsack.solve()
+                self.assertAlmostEqual(knapsack.objective_value, highs_objective(options, problem), places=4)
+                # the greedy fallback is bounded by its gap
+                greedy = KnapsackTransferModel(options, capacity, max_dp_cells=0)
+                greedy.solve()
+                self.assertLessEqual(greedy.objective_value - greedy.gap, knapsack.objective_value + 1e-6)
+                self.assertGreaterEqual(greedy.objective_value, knapsack.objective_value - 1e-6)
+
+    def test_session_matches_fresh_solve(self):
+        problem, model_products = synthetic_curves(80, 30, 2, seed=1)
+        other_problem, other_model_products = synthetic_curves(20, 30, 2, seed=9)
+        rng = np.random.default_rng(0)
+        session = SolverSession()
+        for step in range(6):
+            if step == 1:
+                for sku in list(model_products['origin'])[::3]:
+                    lost_sales = model_products['origin'][sku]['lost_sales']
+                    for quantity in lost_sales:
+                        lost_sales[quantity] *= rng.uniform(0.8, 1.2)
+            elif step == 2:
+                problem.capacity_in_transport_units = 24
+            elif step == 3:
+                for sku in list(model_products['origin'])[:15]:
+                    del model_products['origin'][sku]
+                    del problem.origin_products[sku]
+            elif step == 4:
+                for sku in other_model_products['origin']:
+                    new_sku = 'N' + sku
+                    for warehouse in ('origin', 'destination'):
+                        model_products[warehouse][new_sku] = other_model_products[warehouse][sku]
+                    origin_product = copy.copy(other_problem.origin_products[sku])
+                    origin_product.sku = new_sku
+                    problem.add_origin_product(origin_product)
+            elif step == 5:
+                problem.mandatory_closed_transport_units = 4
+                problem.capacity_in_transport_units = 40
+            with self.subTest(step=step):
+                session.solve(problem, copy.deepcopy(model_products))
+                self.assertAlmostEqual(session.model.objective_value,
+                                       highs_objective(options_of(problem, model_products).prune_dominated(), problem),
+                                       places=4)
+
+    def test_sweep_matches_fresh_solves(self):
+        problem, model_products = synthetic_curves(40, 10, 0, seed=4, mandatory_share=0.3)
+        options = options_of(problem, model_products).prune_dominated()
+        capacities, mandatory_closed = [2, 6, 10, 3], [0, 1]
+        backends = ['HIGHS', 'PULP'] if highs_binary_runs() else ['HIGHS']
+        for backend in backends:
+            solver = Solver(problem, backend=backend)
+            solver.model_products = model_products
+            solver.set_valid_products()
+            frontier = solver.sweep_capacity(capacities, mandatory_closed)
+            self.assertEqual(len(frontier), len(capacities) * len(mandatory_closed))
+            for point in frontier:
+                capacity, closed = point['capacity_in_transport_units'], point['mandatory_closed_transport_units']
+                with self.subTest(backend=backend, capacity=capacity, mandatory_closed=closed):
+                    fresh = HighsTransferModel(options, capacity, closed)
+                    fresh.solve()
+                    self.assertAlmostEqual(point['cost'], fresh.objective_value, places=4)
+                    self.assertAlmostEqual(options.cost_of(point['recommendations']), point['cost'], places=4)
+
+
+if __name__ == '__main__':
+    unittest.main()